@@ -17,7 +17,11 @@ cat = Catalog("http://localhost:8080/geoserver/rest", "admin", "geoserver")
 native_bbox = ['589434.856', '4914006.338', '609527.21', '4928063.398', 'EPSG:26713']
 latlon_bbox = ['-103.877', '44.371', '-103.622', '44.5', 'EPSG:4326']
 
-for rs in cat.get_resources(workspaces='sf'):
+resources = cat.get_resources(workspaces='sf')
+for rs in resources:
     rs.native_bbox = native_bbox
     rs.latlon_bbox = latlon_bbox
-    cat.save(rs)
+
+for result in cat.save_many(resources, concurrency=8):
+    if not result.ok:
+        print("%s: %s" % (result.obj.name, result.error))
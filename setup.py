@@ -23,6 +23,10 @@ setup(
         'gisdata == 0.5.4',
         'future'
     ],
+    extras_require={
+        'async': ['aiohttp >= 3.0'],
+        'netcdf4': ['netCDF4']
+    },
     package_dir={'': 'src'},
     packages=find_packages('src'),
     test_suite="test.catalogtests",
@@ -0,0 +1,335 @@
+'''
+gsconfig is a python library for manipulating a GeoServer instance via the GeoServer RESTConfig API.
+
+The project is distributed under a MIT License .
+'''
+
+__author__ = "David Winslow"
+__copyright__ = "Copyright 2012-2018 Boundless, Copyright 2010-2012 OpenPlans"
+__license__ = "MIT"
+
+import asyncio
+import logging
+from typing import List
+from xml.etree.ElementTree import Element
+
+from geoserver.cache import CachedDocument
+from geoserver.catalog import Catalog, FailedRequestError, _names
+from geoserver.layer import Layer
+from geoserver.resource import featuretype_from_index, coverage_from_index, wmslayer_from_index
+from geoserver.store import coveragestore_from_index, datastore_from_index, wmsstore_from_index
+from geoserver.support import build_url
+from geoserver.workspace import workspace_from_index, Workspace
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    from past.builtins import basestring
+except ImportError:
+    pass
+
+try:
+    from urllib.parse import urlparse, urlencode, parse_qsl
+except ImportError:
+    from urlparse import urlparse, parse_qsl
+    from urllib import urlencode
+
+logger = logging.getLogger("gsconfig.async_catalog")
+
+
+# store resource_type -> (url part of the store collection, url part of its resource listing,
+# xml tag of a listed resource, factory building the resource from that node)
+_STORE_RESOURCES = {
+    "dataStore": ("datastores", "featuretypes", "featureType", featuretype_from_index),
+    "coverageStore": ("coveragestores", "coverages", "coverage", coverage_from_index),
+    "wmsStore": ("wmsstores", "wmslayers", "wmsLayer", wmslayer_from_index),
+}
+
+
+def _resource_href(layer_dom):
+    '''the href of the resource a layer document links to'''
+    resource = layer_dom.find("resource")
+    if resource is None:
+        return None
+    links = [n.get('href') for n in resource if 'href' in n.attrib]
+    return links[0] if links else None
+
+
+class AsyncResponse(object):
+    '''
+        The parts of a requests.Response the catalog code relies on, read
+        from an aiohttp response before its connection is released.
+    '''
+
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+class AsyncCatalog(object):
+    '''
+    An asyncio counterpart of Catalog, doing its I/O on aiohttp
+    (pip install gsconfig[async]).
+
+    get_xml, get_workspaces, get_stores, get_resources, get_layers, fetch, save
+    and delete are coroutines with the arguments of their Catalog namesakes. They
+    return the usual ResourceInfo models, which are bound to a synchronous Catalog
+    (self.catalog) sharing the same response cache. Serialization (obj.message())
+    and cache invalidation are the Catalog's own, the cache is read and filled
+    through Catalog.prepare_get, complete_get and parse_document.
+
+    Models built from a listing (workspaces, stores, resources of a store, layers)
+    come without their document: only name, href and the workspace / store they
+    were listed under can be read without I/O. Any other attribute fetches the
+    document through self.catalog, a blocking request on the event loop unless
+    it is still cached, so await fetch(obj) before reading them. The resources
+    get_resources looks up by name and workspace, and the layers get_layers
+    prefetches or filters by resource, are returned fetched.
+
+    Concurrent identical GETs are coalesced, and at most concurrency requests
+    are in flight at once (the aiohttp connection limit).
+    Use it as an async context manager, or await close() when done.
+
+    catalog: the Catalog to share models and the cache with; by default one is
+    built from the remaining arguments (see Catalog for cache options).
+    '''
+
+    def __init__(self, service_url, username="admin", password="geoserver", validate_ssl_certificate=True,
+                 access_token=None, concurrency=100, catalog=None, **kwargs):
+        if aiohttp is None:
+            raise ImportError("AsyncCatalog requires aiohttp, install it with: pip install gsconfig[async]")
+        if catalog is None:
+            catalog = Catalog(service_url, username, password, validate_ssl_certificate, access_token, **kwargs)
+        self.catalog = catalog
+        self.service_url = catalog.service_url
+        self.concurrency = concurrency
+        self._session = None
+        self._inflight = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        '''the session is created lazily, as it has to be created on the running loop'''
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                ssl=bool(self.catalog.validate_ssl_certificate)
+            )
+            auth = None
+            if not self.catalog.access_token:
+                auth = aiohttp.BasicAuth(self.catalog.username, self.catalog.password)
+            self._session = aiohttp.ClientSession(connector=connector, auth=auth)
+        return self._session
+
+    async def http_request(self, url, data=None, method='get', headers=None) -> AsyncResponse:
+        headers = dict(headers or {})
+        access_token = self.catalog.access_token
+        if access_token:
+            headers['Authorization'] = "Bearer {}".format(access_token)
+            parsed_url = urlparse(url)
+            params = parse_qsl(parsed_url.query.strip())
+            params.append(('access_token', access_token))
+            url = "{proto}://{address}{path}?{params}".format(proto=parsed_url.scheme, address=parsed_url.netloc,
+                                                              path=parsed_url.path, params=urlencode(params))
+
+        async with self._get_session().request(method.upper(), url, data=data, headers=headers) as resp:
+            content = await resp.read()
+            return AsyncResponse(resp.status, content, resp.headers)
+
+    async def get_xml(self, rest_url: str) -> Element:
+        '''
+            See Catalog.get_xml, the cache is the catalog's. Expired entries are
+            revalidated with a conditional GET; stale_while_revalidate is not
+            applied here.
+        '''
+        document, _ = self.catalog.prepare_get(rest_url)
+        if document is None:
+            # a GET started before the last invalidation may return what was just changed, don't join it
+            epoch = self.catalog.cache_epoch()
+            flight = self._inflight.get(rest_url)
+            if flight is None or flight[0] != epoch:
+                flight = self._inflight[rest_url] = (epoch, asyncio.ensure_future(self._load_document(rest_url)))
+                flight[1].add_done_callback(lambda _, flight=flight: self._land(rest_url, flight))
+            # a cancelled caller must not cancel the GET the others are waiting for
+            document = await asyncio.shield(flight[1])
+        return self.catalog.parse_document(rest_url, document)
+
+    def _land(self, rest_url, flight):
+        if self._inflight.get(rest_url) is flight:
+            del self._inflight[rest_url]
+
+    async def _load_document(self, rest_url: str) -> CachedDocument:
+        document, pending = self.catalog.prepare_get(rest_url)
+        if document is not None:
+            return document
+        resp = await self.http_request(rest_url, headers=pending.headers)
+        return self.catalog.complete_get(pending, resp.status_code, resp.content, resp.headers)
+
+    async def _get_xml_or_none(self, rest_url: str):
+        '''like Catalog.get_resources, a store whose resources can't be listed is skipped'''
+        try:
+            return await self.get_xml(rest_url)
+        except FailedRequestError:
+            return None
+
+    async def _get_xml_if_exists(self, rest_url: str):
+        '''only a missing document is None, auth or server errors are raised'''
+        try:
+            return await self.get_xml(rest_url)
+        except FailedRequestError as e:
+            if e.status_code != 404:
+                raise
+            return None
+
+    async def fetch(self, obj):
+        '''the awaitable obj.fetch(): loads obj.dom'''
+        obj.dom = await self.get_xml(obj.href)
+        return obj
+
+    async def get_workspaces(self, names=None) -> List[Workspace]:
+        names = _names(names)
+        data = await self.get_xml("{}/workspaces.xml".format(self.service_url))
+        workspaces = [workspace_from_index(self.catalog, node) for node in data.findall("workspace")]
+        if workspaces and names:
+            return [ws for ws in workspaces if ws.name in names]
+        return workspaces
+
+    async def get_stores(self, names=None, workspaces=None):
+        '''See Catalog.get_stores, the listings of all workspaces are requested concurrently.'''
+        if isinstance(workspaces, Workspace):
+            workspaces = [workspaces]
+        elif not (isinstance(workspaces, list) and [w for w in workspaces if isinstance(w, Workspace)]):
+            workspaces = await self.get_workspaces(names=workspaces)
+
+        urls = []
+        for ws in workspaces:
+            urls.extend([ws.datastore_url, ws.coveragestore_url, ws.wmsstore_url])
+        lists = await asyncio.gather(*[self.get_xml(url) for url in urls])
+
+        stores = []
+        for i, ws in enumerate(workspaces):
+            ds_list, cs_list, wms_list = lists[3 * i:3 * i + 3]
+            stores.extend([datastore_from_index(self.catalog, ws, n) for n in ds_list.findall("dataStore")])
+            stores.extend([coveragestore_from_index(self.catalog, ws, n) for n in cs_list.findall("coverageStore")])
+            stores.extend([wmsstore_from_index(self.catalog, ws, n) for n in wms_list.findall("wmsStore")])
+
+        names = _names(names)
+        if stores and names:
+            return [store for store in stores if store.name in names]
+        return stores
+
+    async def get_resources(self, names=None, stores=None, workspaces=None):
+        '''
+            See Catalog.get_resources. With names and workspaces every name is
+            looked up directly, otherwise the resource listings of all matching
+            stores are requested concurrently.
+        '''
+        if names and workspaces:
+            resources = await self._lookup_resources(_names(names), _names(workspaces))
+            if resources is not None:
+                if stores:
+                    store_names = _names(stores)
+                    resources = [r for r in resources if r.store.name in store_names]
+                return resources
+
+        stores = await self.get_stores(names=stores, workspaces=workspaces)
+        urls = []
+        for store in stores:
+            collection, listing, _, _ = _STORE_RESOURCES[store.resource_type]
+            urls.append(build_url(self.service_url,
+                                  ["workspaces", store.workspace.name, collection, store.name, listing + ".xml"]))
+        lists = await asyncio.gather(*[self._get_xml_or_none(url) for url in urls])
+
+        resources = []
+        for store, listing in zip(stores, lists):
+            if listing is None:
+                continue
+            _, _, tag, from_index = _STORE_RESOURCES[store.resource_type]
+            resources.extend([from_index(self.catalog, store.workspace, store, n) for n in listing.findall(tag)])
+
+        names = _names(names)
+        if resources and names:
+            return [resource for resource in resources if resource.name in names]
+        return resources
+
+    async def _lookup_resources(self, names, workspaces):
+        '''See Catalog._lookup_resources'''
+        lookups = self.catalog.resource_lookups(names, workspaces)
+        doms = await asyncio.gather(*[self._get_xml_if_exists(url) for _, _, url in lookups])
+        return self.catalog.resources_from_lookups(lookups, doms)
+
+    async def get_layers(self, resource=None, prefetch=False):
+        '''
+            See Catalog.get_layers. prefetch loads every Layer.dom concurrently;
+            filtering by resource always does, it compares the resource link of
+            each layer document.
+        '''
+        if isinstance(resource, basestring):
+            ws_name = None
+            if ":" in resource:
+                ws_name, resource = resource.split(':')
+            resource = (await self.get_resources(names=resource, workspaces=ws_name))[0]
+
+        data = await self.get_xml("{}/layers.xml".format(self.service_url))
+        lyrs = [Layer(self.catalog, node.find("name").text) for node in data.findall("layer")]
+        if prefetch or resource is not None:
+            await asyncio.gather(*[self.fetch(lyr) for lyr in lyrs])
+        if resource is not None:
+            lyrs = [lyr for lyr in lyrs if _resource_href(lyr.dom) == resource.href]
+        return lyrs
+
+    async def save(self, obj, content_type="application/xml"):
+        '''See Catalog.save'''
+        rest_url = obj.href
+        data = obj.message()
+        headers = {
+            "Content-type": content_type,
+            "Accept": content_type
+        }
+
+        logger.debug("{} {}".format(obj.save_method, obj.href))
+        resp = await self.http_request(rest_url, method=obj.save_method.lower(), data=data, headers=headers)
+        if resp.status_code not in (200, 201):
+            raise FailedRequestError('Failed to save to Geoserver catalog: {}, {}'.format(resp.status_code, resp.text))
+
+        self.catalog.invalidate_cache(rest_url, getattr(obj, "resource_type", None))
+        return resp
+
+    async def delete(self, config_object, purge=None, recurse=False):
+        '''See Catalog.delete'''
+        rest_url = config_object.href
+        params = []
+        if purge:
+            params.append("purge=" + str(purge))
+        if recurse:
+            params.append("recurse=true")
+        if params:
+            rest_url = rest_url + "?" + "&".join(params)
+
+        headers = {
+            "Content-type": "application/xml",
+            "Accept": "application/xml"
+        }
+        resp = await self.http_request(rest_url, method='delete', headers=headers)
+        if resp.status_code != 200:
+            raise FailedRequestError('Failed to make DELETE request: {}, {}'.format(resp.status_code, resp.text))
+
+        self.catalog.invalidate_deleted(config_object, recurse)
+        return resp
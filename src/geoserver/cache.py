@@ -0,0 +1,325 @@
+'''
+gsconfig is a python library for manipulating a GeoServer instance via the GeoServer RESTConfig API.
+
+The project is distributed under a MIT License .
+'''
+
+__author__ = "David Winslow"
+__copyright__ = "Copyright 2012-2018 Boundless, Copyright 2010-2012 OpenPlans"
+__license__ = "MIT"
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheEntry(object):
+    '''
+        A single cached REST response.
+        value:  the cached payload (a CachedDocument for Catalog.get_xml)
+        size:   the number of bytes charged against the cache's max_bytes
+        stored: the time.monotonic() timestamp at which the entry was (re)stored
+    '''
+    __slots__ = ('value', 'size', 'stored')
+
+    def __init__(self, value, size, stored):
+        self.value = value
+        self.size = size
+        self.stored = stored
+
+    def age(self):
+        return time.monotonic() - self.stored
+
+
+class CachedDocument(object):
+    '''
+        The value Catalog.get_xml stores for a REST url.
+        content: the raw response bytes
+        tree:    the parsed Element, only kept when the catalog caches parsed trees.
+                 It is never handed out, callers get a copy (see copy_tree).
+        etag, last_modified: the response validators, used to revalidate the
+                 document with a conditional GET once it expires
+    '''
+    __slots__ = ('content', 'tree', 'etag', 'last_modified')
+
+    def __init__(self, content, tree=None, etag=None, last_modified=None):
+        self.content = content
+        self.tree = tree
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def copy_tree(self):
+        '''
+            A copy of tree the caller may modify, None if no tree is kept.
+            Copying is several times cheaper than parsing content again.
+        '''
+        return copy.deepcopy(self.tree) if self.tree is not None else None
+
+    @property
+    def validators(self):
+        '''
+            The conditional request headers for this document, empty if the
+            server sent no validators.
+        '''
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PendingGet(object):
+    '''
+        A GET Catalog.prepare_get found no fresh document for, to be passed to
+        Catalog.complete_get with the response.
+        headers: the conditional request headers to send (see CachedDocument.validators)
+        expired: the expired CacheEntry for rest_url, reused on a 304
+        epoch:   Catalog.cache_epoch() before the request, the response is only
+                 stored if it has not changed since
+    '''
+    __slots__ = ('rest_url', 'expired', 'epoch')
+
+    def __init__(self, rest_url, expired, epoch):
+        self.rest_url = rest_url
+        self.expired = expired
+        self.epoch = epoch
+
+    @property
+    def headers(self):
+        return self.expired.value.validators if self.expired is not None else {}
+
+
+class ResponseCache(object):
+    '''
+    A bounded LRU cache of REST responses with a time-to-live.
+
+    Entries are evicted in least-recently-used order once either max_entries
+    or max_bytes is exceeded; a value of None disables that bound. Entries
+    older than ttl seconds are reported as misses by get() but are kept until
+    they are evicted or replaced.
+
+    generation is bumped whenever entries are invalidated (pop, pop_prefix,
+    clear), so indexes derived from cached responses know when to rebuild and
+    responses requested before an invalidation are not stored after it.
+
+    Any object providing get/peek/touch/set/pop/pop_prefix/clear/stats may be
+    passed to Catalog as its cache instead of this class.
+    '''
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=5):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getstate__(self):
+        '''locks cannot be pickled'''
+        state = dict(vars(self))
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def is_fresh(self, entry):
+        return entry is not None and (self.ttl is None or entry.age() < self.ttl)
+
+    def get(self, key, default=None):
+        '''
+            Returns the cached value for key if it is present and younger than
+            the ttl, otherwise default. Counts a hit or a miss.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if not self.is_fresh(entry):
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def peek(self, key):
+        '''
+            Returns the CacheEntry for key whether or not it has expired,
+            without counting a hit or a miss or touching the LRU order.
+        '''
+        with self._lock:
+            return self._entries.get(key)
+
+    def touch(self, key):
+        '''
+            Marks the entry for key as fresh again, eg: after the server
+            answered 304 Not Modified. Returns False if key is not cached.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry.stored = time.monotonic()
+            self._entries.move_to_end(key)
+            self.revalidations += 1
+            return True
+
+    def set(self, key, value, size=None):
+        '''
+            Stores value under key. size defaults to len(value) for bytes and
+            strings and 0 otherwise. Values larger than max_bytes are not stored.
+        '''
+        if size is None:
+            size = len(value) if isinstance(value, (bytes, str)) else 0
+        with self._lock:
+            self._discard(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = CacheEntry(value, size, time.monotonic())
+            self._bytes += size
+            self._evict()
+
+    __setitem__ = set
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._discard(key)
+            if entry is not None:
+                self.generation += 1
+        return entry.value if entry is not None else default
+
+    def pop_prefix(self, prefix):
+        '''
+            Removes every entry whose key starts with prefix and returns how
+            many were removed.
+        '''
+        with self._lock:
+            keys = [k for k in self._entries if k.startswith(prefix)]
+            for k in keys:
+                self._discard(k)
+            if keys:
+                self.generation += 1
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation += 1
+
+    def stats(self):
+        '''
+            Returns the hit/miss/eviction counters and the current usage.
+        '''
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                revalidations=self.revalidations,
+                generation=self.generation,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl
+            )
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _over_bounds(self):
+        too_many = self.max_entries is not None and len(self._entries) > self.max_entries
+        too_large = self.max_bytes is not None and self._bytes > self.max_bytes
+        return too_many or too_large
+
+    def _evict(self):
+        while self._entries and self._over_bounds():
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+
+class _Call(object):
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''
+    Coalesces concurrent calls that share a key: the first caller runs the
+    function, callers arriving while it is in flight wait for and share its
+    result (or exception) instead of running it again.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def __getstate__(self):
+        '''in-flight calls and locks cannot be pickled'''
+        return dict(shared=self.shared)
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.shared = state.get('shared', 0)
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # unless forget_prefix already detached it
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.event.set()
+
+    def forget_prefix(self, prefix):
+        '''
+            Detaches the in-flight calls whose key starts with prefix: callers
+            arriving afterwards start a new call instead of sharing a result
+            that may predate a write. Returns how many were detached.
+        '''
+        with self._lock:
+            keys = [k for k in self._calls if k.startswith(prefix)]
+            for k in keys:
+                del self._calls[k]
+        return len(keys)
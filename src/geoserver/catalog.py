@@ -10,6 +10,9 @@ __copyright__ = "Copyright 2012-2018 Boundless, Copyright 2010-2012 OpenPlans"
 __license__ = "MIT"
 
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # TODO:[-] 20-03-12 此处使用修改后的gsconfig
 # p500
@@ -20,10 +23,9 @@ BUILD_SRC = r'D:\01proj\源码\gsconfig'
 # BUILD_SRC = r'E:\Lab\python lab\gsconfig'
 # sys.path.append(BUILD_SRC)
 
-from datetime import datetime, timedelta
 import logging
 from geoserver.layer import Layer
-from geoserver.resource import FeatureType
+from geoserver.resource import FeatureType, featuretype_from_index, coverage_from_index, wmslayer_from_index
 import sys
 from conf.settings import ENV, DEV_ROOT_PATH
 
@@ -35,6 +37,9 @@ if ENV == 'DEV':
         coveragestore_from_index,
         datastore_from_index,
         wmsstore_from_index,
+        DataStore,
+        CoverageStore,
+        WmsStore,
         UnsavedDataStore,
         UnsavedCoverageStore,
         UnsavedCoverageNcStore,
@@ -45,13 +50,17 @@ else:
         coveragestore_from_index,
         datastore_from_index,
         wmsstore_from_index,
+        DataStore,
+        CoverageStore,
+        WmsStore,
         UnsavedDataStore,
         UnsavedCoverageStore,
         UnsavedWmsStore
     )
 
+from geoserver.cache import ResponseCache, CachedDocument, PendingGet, SingleFlight
 from geoserver.style import Style
-from geoserver.support import prepare_upload_bundle, build_url
+from geoserver.support import build_url, UploadStream, UploadBundle
 from geoserver.layergroup import LayerGroup, UnsavedLayerGroup
 from geoserver.workspace import workspace_from_index, Workspace
 import os
@@ -70,10 +79,10 @@ except ImportError:
     pass
 
 try:
-    from urllib.parse import urlparse, urlencode, parse_qsl
+    from urllib.parse import urlparse, urlencode, parse_qsl, quote, unquote
 except ImportError:
     from urlparse import urlparse, parse_qsl
-    from urllib import urlencode
+    from urllib import urlencode, quote, unquote
 
 try:
     from json.decoder import JSONDecodeError
@@ -86,6 +95,65 @@ from mid_model import CoverageDimensionMidModel
 logger = logging.getLogger("gsconfig.catalog")
 
 
+# resource_type -> top level collections (relative to service_url) whose listings
+# also change when an object of that type is written or deleted, on top of the
+# object itself and its parent collection. See Catalog.invalidate_cache.
+_INVALIDATES = {
+    "workspace": ("namespaces", "layers", "layergroups"),
+    "dataStore": ("layers",),
+    "coverageStore": ("layers",),
+    "wmsStore": ("layers",),
+    "featureType": ("layers",),
+    "coverage": ("layers",),
+    "wmsLayer": ("layers",),
+}
+
+
+# resource_type -> collections below /workspaces/{ws}/ holding other copies of the
+# object: the workspace level resource lookups (see get_resources) and layers.
+_INVALIDATES_IN_WORKSPACE = {
+    "dataStore": ("featuretypes", "layers"),
+    "coverageStore": ("coverages", "layers"),
+    "wmsStore": ("wmslayers", "layers"),
+    "featureType": ("featuretypes", "layers"),
+    "coverage": ("coverages", "layers"),
+    "wmsLayer": ("wmslayers", "layers"),
+}
+
+
+# resource_type -> dependency level for Catalog.delete_many: objects of a level are
+# only deleted once everything of the lower levels that may reference them is gone.
+# Types not listed here (eg: styles) are deleted with the resources.
+_DELETE_LEVELS = {
+    "layerGroup": 0,
+    "layer": 1,
+    "featureType": 2,
+    "coverage": 2,
+    "wmsLayer": 2,
+    "dataStore": 3,
+    "coverageStore": 3,
+    "wmsStore": 3,
+    "workspace": 4,
+}
+
+
+# url part of each store type -> factory building the store from its xml node
+_STORE_FROM_INDEX = {
+    "datastores": datastore_from_index,
+    "coveragestores": coveragestore_from_index,
+    "wmsstores": wmsstore_from_index,
+}
+
+
+# url part of each resource type (below /workspaces/{ws}/) ->
+# (factory building the resource from its xml node, factory building its store from a name)
+_RESOURCE_FROM_INDEX = {
+    "featuretypes": (featuretype_from_index, lambda cat, ws, name: DataStore(cat, ws, name)),
+    "coverages": (coverage_from_index, lambda cat, ws, name: CoverageStore(cat, ws, name)),
+    "wmslayers": (wmslayer_from_index, lambda cat, ws, name: WmsStore(cat, ws, name, None, None)),
+}
+
+
 class UploadError(Exception):
     pass
 
@@ -99,7 +167,30 @@ class AmbiguousRequestError(Exception):
 
 
 class FailedRequestError(Exception):
-    pass
+    '''status_code: the HTTP status of the failed request, when known'''
+
+    def __init__(self, *args, status_code=None):
+        super(FailedRequestError, self).__init__(*args)
+        self.status_code = status_code
+
+
+class BulkResult(object):
+    '''
+        The outcome of one object of a bulk operation (eg: Catalog.save_many):
+        the response on success, the exception raised for it otherwise.
+    '''
+
+    def __init__(self, obj, response=None, error=None):
+        self.obj = obj
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "BulkResult(%r, %s)" % (self.obj, "ok" if self.ok else repr(self.error))
 
 
 def _name(named):
@@ -118,6 +209,28 @@ def _name(named):
         raise ValueError("Can't interpret %s as a name or a configuration object" % named)
 
 
+def _names(named):
+    """Get a list of names out of a comma delimited string, a single object or a
+       list of strings / objects (see _name). None gives an empty list.
+    """
+    if named is None:
+        return []
+    elif isinstance(named, basestring):
+        return [s.strip() for s in named.split(',') if s.strip()]
+    elif isinstance(named, (list, tuple, set)):
+        return [_name(n) for n in named]
+    else:
+        return [_name(named)]
+
+
+def parse_version(version):
+    """Turn a GeoServer version string into a comparable tuple of ints, eg:
+       "2.15.1" -> (2, 15, 1), "2.16-SNAPSHOT" -> (2, 16), "2.2.x" -> (2, 2)
+    """
+    short = re.sub(r'[^\d.]+', '', version).strip('.')
+    return tuple(int(part) for part in short.split('.') if part)
+
+
 class Catalog(object):
     """
     The GeoServer catalog represents all of the information in the GeoServer
@@ -131,10 +244,31 @@ class Catalog(object):
     - Maps, which provide a set of OWS services with a subset of the server's
         Layers
     - Namespaces, which provide unique identifiers for resources
+
+    GET responses are kept in a bounded LRU cache for cache_ttl seconds.
+    cache_max_entries and cache_max_bytes bound its size (None disables a
+    bound); a pre-built cache object (see geoserver.cache.ResponseCache) may
+    be passed as cache instead, e.g. to share one cache between catalogs.
+    With cache_parsed=True the parsed Element is cached next to the raw bytes
+    so cache hits skip XML parsing; every caller gets its own copy of it, which
+    it may modify (eg: a Layer.dom before save()).
+    stale_while_revalidate (seconds) lets get_xml keep serving an entry for
+    that long after it expires while a single background thread refreshes it.
+    A Catalog may be shared between threads: concurrent get_xml misses for the
+    same url are coalesced into a single GET.
+    pool_connections / pool_maxsize / pool_block size the keep-alive connection
+    pool of the underlying requests session (see requests.adapters.HTTPAdapter);
+    raise pool_maxsize to at least the number of threads sharing the catalog.
+    keep_alive=False closes the connection after every request.
+    concurrency is the default number of threads the listing methods use to
+    issue independent requests in parallel (1 keeps them sequential); most of
+    them also take a concurrency argument overriding it per call.
     """
 
     def __init__(self, service_url: str, username="admin", password="geoserver", validate_ssl_certificate=True,
-                 access_token=None):
+                 access_token=None, cache=None, cache_ttl=5, cache_max_entries=256,
+                 cache_max_bytes=64 * 1024 * 1024, cache_parsed=False, stale_while_revalidate=None,
+                 pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True, concurrency=1):
         #
         # TODO:[*] 注意一下此处的 service_url 由 str 被拆分为 数组
         self.service_url: List[str] = service_url.strip("/")
@@ -142,23 +276,52 @@ class Catalog(object):
         self.password = password
         self.validate_ssl_certificate = validate_ssl_certificate
         self.access_token = access_token
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
         self.setup_connection()
 
-        # TODO:[*] 何用？缓存
-        self._cache = {}
+        # 缓存 get_xml 的 response.content (LRU + TTL)
+        if cache is None:
+            cache = ResponseCache(max_entries=cache_max_entries, max_bytes=cache_max_bytes, ttl=cache_ttl)
+        self._cache = cache
+        self.cache_parsed = cache_parsed
+        self.stale_while_revalidate = stale_while_revalidate
+        self.concurrency = concurrency
         self._version = None
+        self._version_info = None
+        self.setup_threading()
 
     def __getstate__(self):
-        '''http connection cannot be pickled'''
+        '''http connection, locks and worker threads cannot be pickled'''
         state = dict(vars(self))
         state.pop('http', None)
         state['http'] = None
+        for k in ('_refresher', '_refreshing', '_refresh_lock', '_inflight', '_version_lock',
+                  '_style_index', '_style_index_lock'):
+            state.pop(k, None)
         return state
 
     def __setstate__(self, state):
         '''restore http connection upon unpickling'''
         self.__dict__.update(state)
         self.setup_connection()
+        self.setup_threading()
+
+    def setup_threading(self):
+        '''
+            locks, in-flight GETs and the (lazily started) background refresh worker
+        '''
+        self._inflight = SingleFlight()
+        self._invalidations = 0
+        self._style_invalidations = 0
+        self._version_lock = threading.Lock()
+        self._style_index = None
+        self._style_index_lock = threading.Lock()
+        self._refresher = None
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
 
     def setup_connection(self):
         self.client = requests.session()
@@ -172,7 +335,48 @@ class Catalog(object):
             method_whitelist=set(['HEAD', 'TRACE', 'GET', 'PUT', 'POST', 'OPTIONS', 'DELETE'])
         )
 
-        self.client.mount("{}://".format(parsed_url.scheme), HTTPAdapter(max_retries=retry))
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=retry
+        )
+        self.client.mount("{}://".format(parsed_url.scheme), adapter)
+        if not self.keep_alive:
+            self.client.headers['Connection'] = 'close'
+
+    def get_pool_stats(self):
+        '''
+            Returns the connection pool settings and, per host connection pool:
+            in_use:      connections currently checked out of the pool
+            idle:        connections waiting in the pool for reuse
+            connections: connections opened so far (more than maxsize means
+                         connections were opened and discarded, raise pool_maxsize)
+            requests:    requests sent through the pool
+        '''
+        adapter = self.client.get_adapter(self.service_url)
+        pools = []
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            idle_slots = pool.pool.qsize() if pool.pool is not None else 0
+            pools.append(dict(
+                host=pool.host,
+                port=pool.port,
+                maxsize=pool.pool.maxsize if pool.pool is not None else 0,
+                in_use=(pool.pool.maxsize - idle_slots) if pool.pool is not None else 0,
+                idle=len([c for c in list(pool.pool.queue) if c is not None]) if pool.pool is not None else 0,
+                connections=pool.num_connections,
+                requests=pool.num_requests
+            ))
+        return dict(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            keep_alive=self.keep_alive,
+            pools=pools
+        )
 
     def http_request(self, url, data=None, method='get', headers={}):
         '''
@@ -196,11 +400,18 @@ class Catalog(object):
 
     def get_version(self):
         '''obtain the version or just 2.2.x if < 2.3.x
+        The version is requested once per catalog and shared by every caller.
         Raises:
             FailedRequestError: If the request fails.
         '''
         if self._version:
             return self._version
+        with self._version_lock:
+            if self._version is None:
+                self._version = self._request_version()
+        return self._version
+
+    def _request_version(self):
         url = "{}/about/version.xml".format(self.service_url)
         resp = self.http_request(url)
         version = None
@@ -221,7 +432,6 @@ class Catalog(object):
         if version is None:
             # just to inform that version < 2.3.x
             version = "2.2.x"
-        self._version = version
         return version
 
     def get_short_version(self):
@@ -231,11 +441,27 @@ class Catalog(object):
         match = re.compile(r'[^\d.]+')
         return match.sub('', gs_version).strip('.')
 
+    def get_version_info(self):
+        '''obtain the geoserver version as a tuple of ints, eg: (2, 15, 1)
+        compare it with tuples: cat.get_version_info() >= (2, 13)
+        (the short version strings compare wrongly: "2.9" >= "2.13")
+        '''
+        if self._version_info is None:
+            self._version_info = parse_version(self.get_version())
+        return self._version_info
+
     def delete(self, config_object, purge=None, recurse=False):
         """
         send a delete request
         XXX [more here]
         """
+        resp = self._delete_request(config_object, purge, recurse)
+        self.invalidate_deleted(config_object, recurse)
+
+        # do we really need to return anything other than None?
+        return (resp)
+
+    def _delete_request(self, config_object, purge=None, recurse=False):
         rest_url = config_object.href
         params = []
 
@@ -258,62 +484,281 @@ class Catalog(object):
         resp = self.http_request(rest_url, method='delete', headers=headers)
         if resp.status_code != 200:
             raise FailedRequestError('Failed to make DELETE request: {}, {}'.format(resp.status_code, resp.text))
+        return resp
 
-        self._cache.clear()
+    def delete_many(self, objs, purge=None, recurse=False, concurrency=None):
+        '''
+            Deletes every object like delete(), in dependency order:
+            layer groups, then layers, then resources and styles, then stores and
+            finally workspaces. The objects of one level are deleted on up to
+            concurrency threads (default self.concurrency) and the next level
+            starts once they are all done. The cache is invalidated once at the end.
+            Does not raise for a failed object: returns one BulkResult per object,
+            in the order of objs.
+        '''
+        results = [BulkResult(obj) for obj in objs]
+        levels = {}
+        for result in results:
+            level = _DELETE_LEVELS.get(getattr(result.obj, "resource_type", None), _DELETE_LEVELS["coverage"])
+            levels.setdefault(level, []).append(result)
 
-        # do we really need to return anything other than None?
-        return (resp)
+        def run(result):
+            try:
+                result.response = self._delete_request(result.obj, purge, recurse)
+            except Exception as e:
+                result.error = e
 
-    def get_xml(self, rest_url: str) -> Element:
+        for level in sorted(levels):
+            self.map(run, levels[level], concurrency)
+
+        for result in results:
+            if result.ok:
+                self.invalidate_deleted(result.obj, recurse)
+        return results
+
+    def invalidate_deleted(self, config_object, recurse=False):
+        '''
+            Evicts the cached responses affected by deleting config_object (see
+            invalidate_cache); with recurse, those of a deleted layer's resource too.
+        '''
+        self.invalidate_cache(config_object.href, getattr(config_object, "resource_type", None))
+        if recurse and getattr(config_object, "resource_type", None) == "layer":
+            # recurse also removes the layer's resource
+            resource = config_object.dom.find("resource") if config_object.dom is not None else None
+            links = [n.get('href') for n in resource if 'href' in n.attrib] if resource is not None else []
+            if links:
+                self.invalidate_cache(links[0], resource.get('class'))
+            else:
+                self.invalidate_cache()
+
+    def get_xml(self, rest_url: str, store=True) -> Element:
         '''
             大体的思路就是将 rest_url中的 response.content 转换为xml对象 Element
+            Expired cache entries that carry an ETag / Last-Modified validator are
+            revalidated with a conditional GET; a 304 reuses the cached document.
+            With stale_while_revalidate an expired entry is returned as is while
+            it is refreshed in the background.
+            store=False still answers from the cache, but a fetched document is not
+            stored (eg: for bulk fetches that would evict the rest of the cache).
         '''
-        # TODO:[*]
-        cached_response = self._cache.get(rest_url)
+        # TODO:[-] 缓存中存在且未过期(ttl)的 response.content (以及 cache_parsed 时解析后的 tree)
+        document = self._cache.get(rest_url)
+        if document is None and not store:
+            document = self._load_document(rest_url, store=False)
+        elif document is None:
+            expired = self._cache.peek(rest_url)
+            if expired is not None and self._is_servable_stale(expired):
+                self._refresh_in_background(rest_url)
+                document = expired.value
+            else:
+                # 并发的相同 url 只发出一次请求
+                document = self._inflight.do(rest_url, self._load_document, rest_url)
+        return self.parse_document(rest_url, document)
 
-        def is_valid(cached_response):
-            return cached_response is not None and datetime.now() - cached_response[0] < timedelta(seconds=5)
+    def _parse_xml(self, rest_url: str, xml: bytes) -> Element:
+        '''
+            将传入的xml_str 转成xml 对象
 
-        def parse_or_raise(xml: str) -> XML:
-            '''
-                将传入的xml_str 转成xml 对象
+        '''
+        try:
+            return XML(xml)
+        except (ExpatError, SyntaxError) as e:
+            msg = "GeoServer gave non-XML response for [GET %s]: %s"
+            msg = msg % (rest_url, xml)
+            raise Exception(msg, e)
 
+    def _load_document(self, rest_url: str, store=True) -> CachedDocument:
+        '''
+            Runs once per in-flight url (see SingleFlight): returns the cached
+            document if another thread stored it since our miss, else fetches it.
+        '''
+        document, pending = self.prepare_get(rest_url)
+        if document is not None:
+            return document
+        # 已过期的缓存若带有 ETag / Last-Modified，则发送条件请求
+        resp = self.http_request(rest_url, headers=pending.headers)
+        return self.complete_get(pending, resp.status_code, resp.content, resp.headers, store)
+
+    # The cache side of get_xml, without the I/O. AsyncCatalog shares the cache
+    # through these and only does the requests itself.
+
+    def prepare_get(self, rest_url: str):
+        '''
+            Returns (document, None) if the cache holds a fresh document for rest_url,
+            else (None, pending): GET rest_url with pending.headers (the validators of
+            an expired entry, for a conditional GET) and pass the response to
+            complete_get(pending, ...).
+        '''
+        entry = self._cache.peek(rest_url)
+        if entry is not None and self._cache.is_fresh(entry):
+            return entry.value, None
+        # a write invalidating the cache while the GET is in flight may make its response outdated
+        return None, PendingGet(rest_url, entry, self.cache_epoch())
+
+    def complete_get(self, pending, status_code, content, headers, store=True) -> CachedDocument:
+        '''
+            The document of the response to a GET prepared by prepare_get: a 304
+            renews and reuses the expired one, a 200 is stored in the cache unless
+            store is False or the cache was invalidated since prepare_get.
+            Raises FailedRequestError for any other status.
+        '''
+        rest_url, expired = pending.rest_url, pending.expired
+        if status_code == 304 and expired is not None:
+            # 未修改: 刷新缓存的时间，不再重新传输 body
+            self._cache.touch(rest_url)
+            return expired.value
+        elif status_code == 200:
             '''
-            try:
-                return XML(xml)
-            except (ExpatError, SyntaxError) as e:
-                msg = "GeoServer gave non-XML response for [GET %s]: %s"
-                msg = msg % (rest_url, xml)
-                raise Exception(msg, e)
-
-        if is_valid(cached_response):
-            raw_text = cached_response[1]
-            return parse_or_raise(raw_text)
-        else:
-            # 做一个认证
-            resp = self.http_request(rest_url)
-            if resp.status_code == 200:
-                #
-                '''
                     content:
                     b'<workspaces>\n  <workspace>\n    <name>cite</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/cite.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>tiger</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/tiger.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>nurc</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/nurc.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>sde</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/sde.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>it.geosolutions</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/it.geosolutions.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>topp</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/topp.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>sf</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/sf.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>my_test_2</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/my_test_2.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>my_test</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/my_test.xml" type="application/atom+xml"/>\n  </workspace>\n  <workspace>\n    <name>SearchRescue</name>\n    <atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="http://localhost:8082/geoserver/rest/workspaces/SearchRescue.xml" type="application/atom+xml"/>\n  </workspace>\n</workspaces>'
-                '''
-                # 将 rest_url 作为 key，response.content作为val 存储在_cache字典中
-                self._cache[rest_url] = (datetime.now(), resp.content)
-                return parse_or_raise(resp.content)
-            else:
-                raise FailedRequestError(resp.content)
+            '''
+            # 将 rest_url 作为 key，response.content作为val 存储在_cache中
+            document = CachedDocument(
+                content,
+                self._parse_xml(rest_url, content) if self.cache_parsed else None,
+                headers.get('ETag'),
+                headers.get('Last-Modified')
+            )
+            if store and self.cache_epoch() == pending.epoch:
+                self._cache.set(rest_url, document, size=len(content))
+            return document
+        else:
+            raise FailedRequestError(content, status_code=status_code)
+
+    def parse_document(self, rest_url: str, document: CachedDocument) -> Element:
+        '''
+            The Element of a document returned by prepare_get / complete_get, a copy
+            the caller may modify when the tree is cached (cache_parsed).
+        '''
+        if document.tree is not None:
+            return document.copy_tree()
+        return self._parse_xml(rest_url, document.content)
+
+    def cache_epoch(self):
+        '''
+            Changes whenever this catalog invalidates the cache, or when entries are
+            invalidated in a (possibly shared) cache that has a generation counter.
+            A GET started before it changed may return what was just written.
+        '''
+        return self._invalidations, getattr(self._cache, 'generation', None)
+
+    def _is_servable_stale(self, entry):
+        if self.stale_while_revalidate is None:
+            return False
+        return entry.age() < self._cache.ttl + self.stale_while_revalidate
+
+    def _refresh_in_background(self, rest_url: str):
+        '''
+            Queues a refresh of rest_url on the single background worker, unless
+            one is already queued or running for that url.
+        '''
+        with self._refresh_lock:
+            if rest_url in self._refreshing:
+                return
+            self._refreshing.add(rest_url)
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(max_workers=1)
+        self._refresher.submit(self._refresh, rest_url)
+
+    def _refresh(self, rest_url: str):
+        try:
+            self._inflight.do(rest_url, self._load_document, rest_url)
+        except Exception as e:
+            # the stale entry keeps being served until it leaves the window
+            logger.warning("Background refresh of %s failed: %s", rest_url, e)
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(rest_url)
+
+    def invalidate_cache(self, href=None, resource_type=None):
+        '''
+            Evicts the cached responses affected by a write to href:
+              - the object itself and everything below it
+                (eg: .../datastores/ds.xml, .../datastores/ds/featuretypes.xml)
+              - its parent collection (eg: .../datastores.xml)
+              - the collections _INVALIDATES lists for resource_type (eg: layers.xml)
+              - the other urls the object is read from (see _alias_prefixes)
+            Unsaved objects POST to their collection with ?name=xx, that name is used
+            as the object. Without href the whole cache is cleared.
+            GETs of the evicted urls that are still in flight are not shared with
+            later callers, and their responses are not cached.
+        '''
+        self._invalidations += 1
+        if href is None or "/styles" in href or resource_type == "workspace":
+            # deleting a workspace deletes its styles
+            self._style_invalidations += 1
+        if href is None:
+            self._cache.clear()
+            self._inflight.forget_prefix('')
+            return
+
+        path, _, query = href.partition('?')
+        name = dict(parse_qsl(query)).get('name')
+        path = re.sub(r'\.(xml|json|sld)$', '', path)
+        if name is not None:
+            parent, path = path, "{}/{}".format(path, quote(name))
+        else:
+            parent = path.rsplit('/', 1)[0]
+
+        prefixes = [parent + '.', path + '.', path + '/']
+        prefixes.extend("{}/{}".format(self.service_url, c) for c in _INVALIDATES.get(resource_type, ()))
+        prefixes.extend(self._alias_prefixes(path, resource_type))
+        for prefix in prefixes:
+            self._cache.pop_prefix(prefix)
+            self._inflight.forget_prefix(prefix)
+
+    def _alias_prefixes(self, path, resource_type):
+        '''
+            The cache key prefixes of the other urls the object at path (without
+            extension) is read from:
+              - stores and resources: the workspace's resource lookups of their
+                kind (/workspaces/{ws}/coverages/...) and its layers
+              - layers: /layers/{ws}:{name}, /layers/{name} and
+                /workspaces/{ws}/{layers.xml, layers/{name}}. The workspace ones
+                are only known if path names the workspace.
+        '''
+        if not path.startswith(self.service_url + '/'):
+            return []
+        segments = [unquote(s) for s in path[len(self.service_url) + 1:].split('/')]
+        ws_name, name = None, segments[-1]
+        if segments[0] == "workspaces" and len(segments) > 2:
+            ws_name = segments[1]
+        elif segments[0] == "layers" and ':' in name:
+            ws_name, name = name.split(':', 1)
+
+        prefixes = []
+        if resource_type == "layer":
+            prefixes.append("{}/layers.".format(self.service_url))
+            prefixes.append("{}/layers/{}.".format(self.service_url, name))
+            if ws_name is not None:
+                prefixes.append("{}/layers/{}:{}.".format(self.service_url, ws_name, name))
+                prefixes.append(build_url(self.service_url, ["workspaces", ws_name, "layers."]))
+                prefixes.append(build_url(self.service_url, ["workspaces", ws_name, "layers", name + "."]))
+        elif ws_name is not None:
+            for collection in _INVALIDATES_IN_WORKSPACE.get(resource_type, ()):
+                prefixes.append(build_url(self.service_url, ["workspaces", ws_name, collection + "."]))
+                prefixes.append(build_url(self.service_url, ["workspaces", ws_name, collection, ""]))
+        return prefixes
+
+    def get_cache_stats(self):
+        '''
+            返回 get_xml 缓存的命中/未命中/淘汰计数以及当前的占用
+            coalesced: 与正在进行中的相同请求合并的次数
+        '''
+        stats = self._cache.stats()
+        stats['coalesced'] = self._inflight.shared
+        return stats
 
     def reload(self):
         url = "{}/reload".format(self.service_url)
         resp = self.http_request(url, method='post')
-        self._cache.clear()
+        self.invalidate_cache()
         return resp
 
     def reset(self):
         url = "{}/reset".format(self.service_url)
         resp = self.http_request(url, method='post')
-        self._cache.clear()
+        self.invalidate_cache()
         return resp
 
     def save(self, obj, content_type="application/xml"):
@@ -335,20 +780,73 @@ class Catalog(object):
         #
         data = obj.message()
 
+        resp = self._save_request(rest_url, obj.save_method, data, content_type)
+        self.invalidate_cache(rest_url, getattr(obj, "resource_type", None))
+        return resp
+
+    def _save_request(self, rest_url, save_method, data, content_type="application/xml"):
         headers = {
             "Content-type": content_type,
             "Accept": content_type
         }
 
-        logger.debug("{} {}".format(obj.save_method, obj.href))
-        resp = self.http_request(rest_url, method=obj.save_method.lower(), data=data, headers=headers)
+        logger.debug("{} {}".format(save_method, rest_url))
+        resp = self.http_request(rest_url, method=save_method.lower(), data=data, headers=headers)
 
         if resp.status_code not in (200, 201):
             raise FailedRequestError('Failed to save to Geoserver catalog: {}, {}'.format(resp.status_code, resp.text))
-
-        self._cache.clear()
         return resp
 
+    def save_many(self, objs, concurrency=None, content_type="application/xml"):
+        '''
+            Saves every object like save(), issuing the requests on up to concurrency
+            threads (default self.concurrency) over the pooled session.
+            All messages are serialized before the first request is sent, and the
+            cache is invalidated once every request has finished.
+            Does not raise for a failed object: returns one BulkResult per object,
+            in the order of objs.
+        '''
+        results = []
+        jobs = []
+        for obj in objs:
+            result = BulkResult(obj)
+            results.append(result)
+            try:
+                jobs.append((result, obj.href, obj.save_method, obj.message()))
+            except Exception as e:
+                result.error = e
+
+        def run(job):
+            result, rest_url, save_method, data = job
+            try:
+                result.response = self._save_request(rest_url, save_method, data, content_type)
+            except Exception as e:
+                result.error = e
+
+        self.map(run, jobs, concurrency)
+
+        for result, rest_url, _, _ in jobs:
+            if result.ok:
+                self.invalidate_cache(rest_url, getattr(result.obj, "resource_type", None))
+        return results
+
+    def map(self, fn, items, concurrency=None):
+        '''
+            Calls fn on every item using up to concurrency threads (default
+            self.concurrency) and returns the results in the order of items.
+            As with a plain loop, the first exception in item order is raised.
+            The batch helpers of the catalog use it, and it is there for callers
+            issuing their own requests through the catalog (e.g. CustomerLayer.publish_many);
+            fn is called from several threads, so it should only share the catalog.
+        '''
+        items = list(items)
+        if concurrency is None:
+            concurrency = self.concurrency
+        if not concurrency or concurrency <= 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as executor:
+            return list(executor.map(fn, items))
+
     def _return_first_item(self, _list):
         if len(_list) == 0:
             return None
@@ -357,9 +855,11 @@ class Catalog(object):
         else:
             return _list[0]
 
-    def get_stores(self, names=None, workspaces=None):
+    def get_stores(self, names=None, workspaces=None, concurrency=None):
         '''
           Returns a list of stores in the catalog. If workspaces is specified will only return stores in those workspaces.
+          The store listings of all workspaces are requested on up to concurrency threads (default self.concurrency);
+          the result order does not depend on it.
           从 catalog 返回 stores列表，若指定了名称则只返回匹配的store
           返回类型为 geoserver.store 中的store实现
           If names is specified, will only return stores that match.
@@ -380,10 +880,14 @@ class Catalog(object):
         stores = []
 
         # TODO: 20-03-13 从workspaces 中遍历,获取data store coverage store 与 wms store 的所有的list
+        workspaces = list(workspaces)
+        urls = []
         for ws in workspaces:
-            ds_list: Element = self.get_xml(ws.datastore_url)
-            cs_list: Element = self.get_xml(ws.coveragestore_url)
-            wms_list: Element = self.get_xml(ws.wmsstore_url)
+            urls.extend([ws.datastore_url, ws.coveragestore_url, ws.wmsstore_url])
+        lists: List[Element] = self.map(self.get_xml, urls, concurrency)
+
+        for i, ws in enumerate(workspaces):
+            ds_list, cs_list, wms_list = lists[3 * i:3 * i + 3]
             # TODO:[*] 比较重要
             # 从 ds_list 中找到所有的 dataStore 的节点
             stores.extend([datastore_from_index(self, ws, n) for n in ds_list.findall("dataStore")])
@@ -400,14 +904,52 @@ class Catalog(object):
 
         return stores
 
-    def get_store(self, name, workspace=None):
+    def get_store(self, name, workspace=None, store_types=None, concurrency=None):
         '''
           Returns a single store object.
           Will return None if no store is found.
           Will raise an error if more than one store with the same name is found.
+          When both name and workspace are given the store is fetched directly from
+          /workspaces/{ws}/{datastores|coveragestores|wmsstores}/{name}.xml instead of listing every store:
+            - store_types=None probes all three types (on up to concurrency threads)
+            - store_types=('coveragestores', ...) probes only those, in that order, and returns the first match
+          Several names or workspaces (lists or comma delimited strings) are looked up in the store listings.
         '''
+        single_name = isinstance(name, basestring) and ',' not in name
+        single_workspace = isinstance(workspace, Workspace) or (
+            isinstance(workspace, basestring) and ',' not in workspace and bool(workspace.strip()))
+        if single_name and single_workspace:
+            return self._probe_store(name.strip(), _name(workspace).strip(), store_types, concurrency)
 
         stores = self.get_stores(workspaces=workspace, names=name)
+        if store_types is not None:
+            stores = [store for store in stores if store.resource_type.lower() + "s" in store_types]
+        return self._return_first_item(stores)
+
+    def _probe_store(self, name, ws_name, store_types=None, concurrency=None):
+        ws = Workspace(self, ws_name)
+
+        def probe(store_type):
+            url = build_url(self.service_url, ["workspaces", ws.name, store_type, name + ".xml"])
+            try:
+                dom = self.get_xml(url)
+            except FailedRequestError as e:
+                # only a missing store is a miss, auth or server errors are raised
+                if e.status_code != 404:
+                    raise
+                return None
+            store = _STORE_FROM_INDEX[store_type](self, ws, dom)
+            store.dom = dom
+            return store
+
+        if store_types is not None:
+            for store_type in store_types:
+                store = probe(store_type)
+                if store is not None:
+                    return store
+            return None
+
+        stores = [store for store in self.map(probe, _STORE_FROM_INDEX.keys(), concurrency) if store is not None]
         return self._return_first_item(stores)
 
     def create_datastore(self, name, workspace=None):
@@ -443,10 +985,18 @@ class Catalog(object):
         if resp.status_code not in (200, 201):
             raise FailedRequestError('Failed to create WMS layer: {}, {}'.format(resp.status_code, resp.text))
 
-        self._cache.clear()
+        self.invalidate_cache(url, "wmsLayer")
         return self.get_layer(name)
 
-    def add_data_to_store(self, store, name, data, workspace=None, overwrite=False, charset=None):
+    def add_data_to_store(self, store, name, data, workspace=None, overwrite=False, charset=None, progress=None,
+                          compresslevel=None):
+        '''
+            data: the path of a zip bundle, or a dict of extensions to paths / file-like
+            objects zipped on the fly while they are uploaded (see UploadBundle, which
+            compresslevel is passed to).
+            progress: optional callable(bytes_sent, total), see UploadStream.
+            The bundle is streamed from disk, never read into memory as a whole.
+        '''
         if isinstance(store, basestring):
             store = self.get_stores(names=store, workspaces=workspace)[0]
         if workspace is not None:
@@ -457,11 +1007,6 @@ class Catalog(object):
             workspace = store.workspace.name
         store = store.name
 
-        if isinstance(data, dict):
-            bundle = prepare_upload_bundle(name, data)
-        else:
-            bundle = data
-
         params = dict()
         if overwrite:
             params["update"] = "overwrite"
@@ -484,19 +1029,30 @@ class Catalog(object):
             params
         )
 
+        if isinstance(data, dict):
+            bundle = UploadBundle(name, data, compresslevel, progress=progress)
+        else:
+            bundle = UploadStream(data, progress)
+
         try:
-            with open(bundle, "rb") as f:
-                data = f.read()
-                resp = self.http_request(upload_url, method='put', data=data, headers=headers)
-                if resp.status_code != 201:
-                    FailedRequestError(
-                        'Failed to add data to store {} : {}, {}'.format(store, resp.status_code, resp.text))
-                self._cache.clear()
+            resp = self.http_request(upload_url, method='put', data=bundle, headers=headers)
+            if resp.status_code != 201:
+                FailedRequestError(
+                    'Failed to add data to store {} : {}, {}'.format(store, resp.status_code, resp.text))
+            self.invalidate_cache(
+                build_url(self.service_url, ["workspaces", workspace, "datastores", store + ".xml"]), "dataStore")
         finally:
-            # os.unlink(bundle)
-            pass
+            if hasattr(bundle, "close"):
+                bundle.close()
 
-    def create_featurestore(self, name, data, workspace=None, overwrite=False, charset=None):
+    def create_featurestore(self, name, data, workspace=None, overwrite=False, charset=None, progress=None,
+                            compresslevel=None):
+        '''
+            data: the path of a zip bundle (deleted once uploaded), or a dict of extensions
+            to paths / file-like objects zipped on the fly (see UploadBundle, which
+            compresslevel is passed to)
+            progress: optional callable(bytes_sent, total), see UploadStream
+        '''
         if workspace is None:
             workspace = self.get_default_workspace()
         workspace = _name(workspace)
@@ -529,22 +1085,29 @@ class Catalog(object):
         }
         if isinstance(data, dict):
             logger.debug('Data is NOT a zipfile')
-            archive = prepare_upload_bundle(name, data)
+            archive = None
+            body = UploadBundle(name, data, compresslevel, progress=progress)
         else:
             logger.debug('Data is a zipfile')
             archive = data
-        file_obj = open(archive, 'rb')
+            body = UploadStream(archive, progress)
         try:
-            resp = self.http_request(url, method='put', data=file_obj, headers=headers)
+            resp = self.http_request(url, method='put', data=body, headers=headers)
             if resp.status_code != 201:
                 FailedRequestError(
                     'Failed to create FeatureStore {} : {}, {}'.format(name, resp.status_code, resp.text))
-            self._cache.clear()
+            self.invalidate_cache(
+                build_url(self.service_url, ["workspaces", workspace, "datastores", name + ".xml"]), "dataStore")
         finally:
-            file_obj.close()
-            os.unlink(archive)
+            if archive is not None:
+                body.close()
+                os.unlink(archive)
 
-    def create_imagemosaic(self, name, data, configure='first', workspace=None, overwrite=False, charset=None):
+    def create_imagemosaic(self, name, data, configure='first', workspace=None, overwrite=False, charset=None,
+                           progress=None):
+        '''
+            progress: optional callable(bytes_sent, total) for zip uploads, see UploadStream
+        '''
         if workspace is None:
             workspace = self.get_default_workspace()
         workspace = _name(workspace)
@@ -566,10 +1129,10 @@ class Catalog(object):
 
         if hasattr(data, 'read'):
             # Adding this check only to pass tests. We should drop support for passing a file object
-            upload_data = data
+            upload_data = UploadStream(data, progress)
         elif isinstance(data, basestring):
             if os.path.splitext(data)[-1] == ".zip":
-                upload_data = open(data, 'rb')
+                upload_data = UploadStream(data, progress)
             else:
                 store_type = "external.imagemosaic"
                 contet_type = "text/plain"
@@ -599,7 +1162,9 @@ class Catalog(object):
             resp = self.http_request(url, method='put', data=upload_data, headers=headers)
             if resp.status_code != 201:
                 FailedRequestError('Failed to create ImageMosaic {} : {}, {}'.format(name, resp.status_code, resp.text))
-            self._cache.clear()
+            self.invalidate_cache(
+                build_url(self.service_url, ["workspaces", workspace, "coveragestores", name + ".xml"]),
+                "coverageStore")
         finally:
             if hasattr(upload_data, "close"):
                 upload_data.close()
@@ -608,7 +1173,7 @@ class Catalog(object):
 
     def create_coveragestore(self, name, workspace=None, path=None, type='GeoTIFF',
                              create_layer=True, layer_name=None, source_name=None, upload_data=False,
-                             contet_type="image/tiff"):
+                             contet_type="image/tiff", progress=None):
         """
         TODO:[-] 目前看支持的type不包含nc,已改造
                 layer_name 为创建的图层的名称
@@ -620,6 +1185,8 @@ class Catalog(object):
         If create_layer is set to true, will create a coverage/layer.
         layer_name and source_name are only used if create_layer ia enabled.
         If not specified, the raster name will be used for both.
+        With upload_data the raster is streamed from disk; progress is an optional
+        callable(bytes_sent, total), see UploadStream.
         """
         if path is None:
             raise Exception('You must provide a full path to the raster')
@@ -683,11 +1250,10 @@ class Catalog(object):
                     FailedRequestError('Failed to create coverage/layer {} for : {}, {}'.format(layer_name, name,
                                                                                                 resp.status_code,
                                                                                                 resp.text))
-                self._cache.clear()
+                self.invalidate_cache(url, "coverage")
                 return self.get_resources(names=layer_name, workspaces=workspace)[0]
         # 以下提交的data是通过读取后再put提交，不使用此种方式
         else:
-            data = open(path, 'rb')
             params = {"configure": "first", "coverageName": name}
             url = build_url(
                 self.service_url,
@@ -703,15 +1269,16 @@ class Catalog(object):
             )
 
             headers = {"Content-type": contet_type}
-            resp = self.http_request(url, method='put', data=data, headers=headers)
-
-            if hasattr(data, "close"):
-                data.close()
+            with UploadStream(path, progress) as data:
+                resp = self.http_request(url, method='put', data=data, headers=headers)
 
             if resp.status_code != 201:
                 FailedRequestError(
                     'Failed to create coverage/layer {} for : {}, {}'.format(layer_name, name, resp.status_code,
                                                                              resp.text))
+            self.invalidate_cache(
+                build_url(self.service_url, ["workspaces", workspace, "coveragestores", name + ".xml"]),
+                "coverageStore")
 
         return self.get_stores(names=name, workspaces=workspace)[0]
 
@@ -764,12 +1331,66 @@ class Catalog(object):
         # TODO:[*] 20-03-20 当创建完coverage layer 后，需要手动的设置该 layer 的 style
         pass
 
-    def add_granule(self, data, store, workspace=None):
-        '''Harvest/add a granule into an existing imagemosaic'''
+    def add_granule(self, data, store, workspace=None, progress=None):
+        '''Harvest/add a granule into an existing imagemosaic
+           progress: optional callable(bytes_sent, total) for zip uploads, see UploadStream
+        '''
+        store_name, workspace_name = self._mosaic_names(store, workspace)
+        resp = self._add_granule_request(data, store_name, workspace_name, progress)
+        if resp.status_code != 202:
+            FailedRequestError(
+                'Failed to add granule to mosaic {} : {}, {}'.format(store, resp.status_code, resp.text))
+        self.invalidate_cache(
+            build_url(self.service_url, ["workspaces", workspace_name, "coveragestores", store_name + ".xml"]))
+
+        # maybe return a list of all granules?
+        return None
+
+    def add_granules(self, paths, store, workspace=None, concurrency=None):
+        '''
+            Harvests every path into an existing imagemosaic like add_granule, on up to
+            concurrency threads (default self.concurrency), and invalidates the cache once.
+            Zip files are uploaded, other paths are harvested in place (external.imagemosaic).
+            GeoServer takes a single path per harvest request, a directory path harvests
+            every granule below it in one request.
+            Does not raise for a failed granule: returns one BulkResult per path.
+        '''
+        store_name, workspace_name = self._mosaic_names(store, workspace)
+        results = [BulkResult(path) for path in paths]
+
+        def run(result):
+            try:
+                result.response = self._add_granule_request(result.obj, store_name, workspace_name)
+                if result.response.status_code not in (201, 202):
+                    result.error = FailedRequestError('Failed to add granule {} to mosaic {} : {}, {}'.format(
+                        result.obj, store_name, result.response.status_code, result.response.text))
+            except Exception as e:
+                result.error = e
+
+        self.map(run, results, concurrency)
+        if any(result.ok for result in results):
+            self.invalidate_cache(
+                build_url(self.service_url, ["workspaces", workspace_name, "coveragestores", store_name + ".xml"]))
+        return results
+
+    def _mosaic_names(self, store, workspace=None):
+        '''the (store name, workspace name) of an imagemosaic given by name or as a store'''
+        workspace_name = workspace
+        if isinstance(store, basestring):
+            store_name = store
+        else:
+            store_name = store.name
+            workspace_name = store.workspace.name
+
+        if workspace_name is None:
+            raise ValueError("Must specify workspace")
+        return store_name, workspace_name
+
+    def _add_granule_request(self, data, store_name, workspace_name, progress=None):
         ext = os.path.splitext(data)[-1]
         if ext == ".zip":
             type = "file.imagemosaic"
-            upload_data = open(data, 'rb')
+            upload_data = UploadStream(data, progress)
             headers = {
                 "Content-type": "application/zip",
                 "Accept": "application/xml"
@@ -782,17 +1403,6 @@ class Catalog(object):
                 "Accept": "application/xml"
             }
 
-        params = dict()
-        workspace_name = workspace
-        if isinstance(store, basestring):
-            store_name = store
-        else:
-            store_name = store.name
-            workspace_name = store.workspace.name
-
-        if workspace_name is None:
-            raise ValueError("Must specify workspace")
-
         url = build_url(
             self.service_url,
             [
@@ -802,22 +1412,15 @@ class Catalog(object):
                 store_name,
                 type
             ],
-            params
+            dict()
         )
 
         try:
-            resp = self.http_request(url, method='post', data=upload_data, headers=headers)
-            if resp.status_code != 202:
-                FailedRequestError(
-                    'Failed to add granule to mosaic {} : {}, {}'.format(store, resp.status_code, resp.text))
-            self._cache.clear()
+            return self.http_request(url, method='post', data=upload_data, headers=headers)
         finally:
             if hasattr(upload_data, "close"):
                 upload_data.close()
 
-        # maybe return a list of all granules?
-        return None
-
     def delete_granule(self, coverage, store, granule_id, workspace=None):
         '''Deletes a granule of an existing imagemosaic'''
         params = dict()
@@ -858,7 +1461,8 @@ class Catalog(object):
         if resp.status_code != 200:
             FailedRequestError(
                 'Failed to delete granule from mosaic {} : {}, {}'.format(store, resp.status_code, resp.text))
-        self._cache.clear()
+        self.invalidate_cache(
+            build_url(self.service_url, ["workspaces", workspace_name, "coveragestores", store_name + ".xml"]))
 
         # maybe return a list of all granules?
         return None
@@ -908,10 +1512,35 @@ class Catalog(object):
         if resp.status_code != 200:
             FailedRequestError(
                 'Failed to list granules in mosaic {} : {}, {}'.format(store, resp.status_code, resp.text))
-
-        self._cache.clear()
         return resp.json()
 
+    def iter_granules(self, coverage, store, workspace=None, filter=None, page_size=1000, prefetch=False):
+        '''
+            Yields the granule features of an imagemosaic one at a time, requesting
+            them page_size at a time with limit/offset (see list_granules), so only
+            one page is held in memory. With prefetch the next page is requested in
+            the background while the current one is consumed (two pages in memory).
+        '''
+        def page(offset):
+            return self.list_granules(coverage, store, workspace, filter, limit=page_size, offset=offset)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            offset = 0
+            pending = executor.submit(page, offset) if executor else None
+            while True:
+                features = (pending.result() if pending else page(offset)).get('features') or []
+                offset += page_size
+                last = len(features) < page_size
+                pending = executor.submit(page, offset) if executor and not last else None
+                for feature in features:
+                    yield feature
+                if last:
+                    return
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
     def mosaic_coverages(self, store):
         '''Returns all coverages in a coverage store'''
         params = dict()
@@ -935,8 +1564,6 @@ class Catalog(object):
         resp = self.http_request(url, headers=headers)
         if resp.status_code != 200:
             FailedRequestError('Failed to get mosaic coverages {} : {}, {}'.format(store, resp.status_code, resp.text))
-
-        self._cache.clear()
         return resp.json()
 
     def mosaic_coverage_schema(self, coverage, store, workspace):
@@ -965,8 +1592,6 @@ class Catalog(object):
         resp = self.http_request(url, headers=headers)
         if resp.status_code != 200:
             FailedRequestError('Failed to get mosaic schema {} : {}, {}'.format(store, resp.status_code, resp.text))
-
-        self._cache.clear()
         return resp.json()
 
     def publish_featuretype(self, name, store, native_crs, srs=None, jdbc_virtual_table=None, native_name=None):
@@ -1015,19 +1640,29 @@ class Catalog(object):
         if resp.status_code not in (200, 201, 202):
             FailedRequestError('Failed to publish feature type {} : {}, {}'.format(name, resp.status_code, resp.text))
 
-        self._cache.clear()
+        self.invalidate_cache(resource_url, "featureType")
         feature_type.fetch()
         return feature_type
 
-    def get_resources(self, names=None, stores=None, workspaces=None):
+    def get_resources(self, names=None, stores=None, workspaces=None, concurrency=None):
         '''
         Resources include feature stores, coverage stores and WMS stores, however does not include layer groups.
         names, stores and workspaces can be provided as a comma delimited strings or as arrays, and are used for filtering.
         Will always return an array.
+        When both names and workspaces are given each resource is fetched directly from the workspace's
+        featuretypes / coverages / wmslayers endpoints (on up to concurrency threads); every store is only
+        enumerated if a name matches more than one resource in a workspace.
         资源包括特性库、覆盖库和WMS库，但是不包括层组。
         名称、存储和工作区可以作为逗号分隔的字符串或数组提供，并用于筛选。
         将始终返回一个数组。
         '''
+        if names and workspaces:
+            resources = self._lookup_resources(_names(names), _names(workspaces), concurrency)
+            if resources is not None:
+                if stores:
+                    store_names = _names(stores)
+                    resources = [r for r in resources if r.store.name in store_names]
+                return resources
 
         stores = self.get_stores(
             names=stores,
@@ -1051,6 +1686,64 @@ class Catalog(object):
 
         return resources
 
+    def _lookup_resources(self, names, workspaces, concurrency=None):
+        '''
+            Fetches every name in every workspace from the workspace level featuretypes, coverages
+            and wmslayers endpoints. Returns None if a name is ambiguous within a workspace.
+        '''
+        lookups = self.resource_lookups(names, workspaces)
+
+        def probe(lookup):
+            try:
+                return self.get_xml(lookup[2])
+            except FailedRequestError as e:
+                # only a missing resource is a miss, auth or server errors are raised
+                if e.status_code != 404:
+                    raise
+                return None
+
+        return self.resources_from_lookups(lookups, self.map(probe, lookups, concurrency))
+
+    # The direct lookup of get_resources(names, workspaces), without the I/O (shared with AsyncCatalog).
+
+    def resource_lookups(self, names, workspaces):
+        '''
+            The urls every name is looked up at in every workspace, as
+            (workspace name, resource type, url) for each resource type.
+        '''
+        return [(ws_name, resource_type, build_url(self.service_url, ["workspaces", ws_name, resource_type, name + ".xml"]))
+                for ws_name in workspaces for name in names for resource_type in _RESOURCE_FROM_INDEX]
+
+    def resources_from_lookups(self, lookups, doms):
+        '''
+            The resources found by resource_lookups, given the document of every
+            lookup (None where there is none). None if a name matches more than one
+            resource in a workspace.
+        '''
+        found = []
+        for (ws_name, resource_type, _), dom in zip(lookups, doms):
+            # <store class="dataStore"><name>ws:store</name>...
+            store_name = dom.findtext("store/name") if dom is not None else None
+            if store_name is None:
+                found.append(None)
+                continue
+            if store_name.startswith(ws_name + ":"):
+                store_name = store_name[len(ws_name) + 1:]
+            resource_from_index, store_from_name = _RESOURCE_FROM_INDEX[resource_type]
+            ws = Workspace(self, ws_name)
+            resource = resource_from_index(self, ws, store_from_name(self, ws, store_name), dom)
+            resource.dom = dom
+            found.append(resource)
+
+        resources = []
+        step = len(_RESOURCE_FROM_INDEX)
+        for i in range(0, len(found), step):
+            matches = [r for r in found[i:i + step] if r is not None]
+            if len(matches) > 1:
+                return None
+            resources.extend(matches)
+        return resources
+
     def get_resource(self, name=None, store=None, workspace=None):
         '''
           returns a single resource object.
@@ -1069,24 +1762,45 @@ class Catalog(object):
         except FailedRequestError:
             return None
 
-    def get_layers(self, resource=None):
+    def get_layers(self, resource=None, prefetch=False, concurrency=None):
         '''
             TODO:[*] 此处调用了 self.get_xml
+            prefetch: fetch the layer documents (Layer.dom) before returning, on up
+            to concurrency threads (default self.concurrency), instead of one GET per
+            layer on its first attribute access (see _prefetch).
         '''
         if isinstance(resource, basestring):
-            if self.get_short_version() >= "2.13":
+            if self.get_version_info() >= (2, 13):
                 if ":" in resource:
                     ws_name, resource = resource.split(':')
 
             resource = self.get_resources(names=resource)[0]
         layers_url = "{}/layers.xml".format(self.service_url)
         data = self.get_xml(layers_url)
-        lyrs = [Layer(self, l.find("name").text) for l in data.findall("layer")]
+        lyrs = [Layer(self, node.find("name").text) for node in data.findall("layer")]
+        if prefetch:
+            self._prefetch(lyrs, concurrency)
         if resource is not None:
-            lyrs = [l for l in lyrs if l.resource.href == resource.href]
+            lyrs = [lyr for lyr in lyrs if lyr.resource.href == resource.href]
         # TODO: Filter by style
         return lyrs
 
+    def _prefetch(self, objs, concurrency=None):
+        '''
+            Fetches obj.dom for every obj on up to concurrency threads. The documents
+            are kept on the objects only, not in the cache, so that prefetching
+            thousands of layers does not evict the rest of it. A failed fetch is
+            logged and left to the first attribute access, which fetches (and
+            raises) as usual.
+        '''
+        def fetch(obj):
+            try:
+                obj.dom = self.get_xml(obj.href, store=False)
+            except Exception as e:
+                logger.warning("Prefetching %s failed: %s", obj.href, e)
+
+        self.map(fetch, objs, concurrency)
+
     def get_layergroups(self, names=None, workspaces=None):
         '''
         names and workspaces can be provided as a comma delimited strings or as arrays, and are used for filtering.
@@ -1197,6 +1911,40 @@ class Catalog(object):
 
         return all_styles
 
+    def resolve_style(self, name, workspace=None):
+        '''
+          returns the style named name in workspace (or, without workspace, the
+          global style and then the first workspace style of that name) from an
+          in-memory index of every style in the catalog.
+          The index is built once and rebuilt after a style or workspace is written
+          through this catalog (see invalidate_cache) or after cache_ttl seconds, so
+          resolving the styles of many layers costs one style listing instead of one
+          per layer, and writes to layers or stores keep it.
+          Falls back to get_styles when the name is not indexed.
+        '''
+        by_fqn, by_name = self._get_style_index()
+        style = by_fqn.get((workspace, name)) if workspace else by_name.get(name)
+        if style is not None:
+            return style
+        styles = self.get_styles(names=name, workspaces=workspace)
+        return styles[0] if styles else None
+
+    def _get_style_index(self):
+        ttl = getattr(self._cache, 'ttl', None)
+        with self._style_index_lock:
+            invalidations = self._style_invalidations
+            index = self._style_index
+            expired = index is not None and ttl is not None and time.monotonic() - index[1] >= ttl
+            if index is None or index[0] != invalidations or expired:
+                by_fqn, by_name = {}, {}
+                # global styles come first, so they win by_name like in get_styles
+                for style in self.get_styles():
+                    by_fqn[(style.workspace, style.name)] = style
+                    by_name.setdefault(style.name, style)
+                # a style written while listing them changes the counter again, so it is rebuilt then
+                index = self._style_index = (invalidations, time.monotonic(), (by_fqn, by_name))
+            return index[2]
+
     def get_style(self, name, workspace=None):
         '''
           returns a single style object.
@@ -1242,8 +1990,7 @@ class Catalog(object):
         if resp.status_code not in (200, 201, 202):
             FailedRequestError('Failed to create style {} : {}, {}'.format(name, resp.status_code, resp.text))
 
-        self._cache.pop(style.href, None)
-        self._cache.pop(style.body_href, None)
+        self.invalidate_cache(style.href, "style")
 
     def create_workspace(self, name, uri):
         '''
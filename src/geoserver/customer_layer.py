@@ -1,11 +1,12 @@
-import requests
-from xml.etree.ElementTree import tostring
-from catalog import Catalog
-from typing import List, Dict
+from catalog import Catalog, BulkResult
+from typing import List, Dict, Iterable, Tuple
 from mid_model import CoverageDimensionMidModel
-from support import coverageview_xml
+from support import build_url, CoverageViewTemplate
 from common import LayerError, GeoServerError
 
+# build_coverage 生成的 coverage xml 的预编译模板, 第一次使用时编译 (见 CoverageLayer._template)
+_coverage_template = None
+
 
 class CoverageLayer:
     def __init__(self, catalog: Catalog, work_space: str, store_name: str):
@@ -29,13 +30,31 @@ class CoverageLayer:
     @property
     def msg(self):
         '''
-            需要提交的 data
+            需要提交的 data (dict_coverage 示例模板生成的 xml)
+        '''
+        return self._msg(self.dict_coverage)
+
+    @staticmethod
+    def _msg(coverage: dict) -> bytes:
+        '''
+            将 coverage 字典 (见 build_coverage) 转成需要提交的 xml
+        '''
+        return CoverageLayer._template().render(coverage)
+
+    @staticmethod
+    def _template() -> CoverageViewTemplate:
+        '''
+            build_coverage 结构的 coverage 的预编译模板: 静态部分只序列化一次，每次只填入 layer 的值
+            (name, namespace, store, bands, dimensions)，输出与 coverageview_xml 逐字节一致
         '''
-        builder = coverageview_xml(self.dict_coverage)
-        msg = tostring(builder.close(), encoding='utf-8', method='xml')
-        # print(msg)
-        return msg
+        global _coverage_template
+        if _coverage_template is None:
+            prototype = CoverageLayer(None, 'workspace', 'store').build_coverage('layer', [dict(name='band')])
+            _coverage_template = CoverageViewTemplate(prototype)
+        return _coverage_template
 
+    # 以下两个类属性只是 coverage 字典的示例模板，只读: 发布时每次调用都通过 build_coverage 生成新的字典，
+    # 因此多个 publish 可以并发执行
     dict_coverage = dict(
         name='ceshi_coverage_01',
         nativeName='ceshi_coverage_01',
@@ -100,137 +119,148 @@ class CoverageLayer:
         )
     )
 
-    def _create_layer(self, layer_name: str, store_name: str, title: str, bands: List[Dict[str, str]] = []):
-        is_do = False
+    def _create_layer(self, layer_name: str, store_name: str, title: str, bands: List[Dict[str, str]] = None):
+        '''
+            返回需要提交的 coverage 字典，store 不存在时返回 None
+            每次调用都生成新的字典，不修改 dict_coverage / dict_meta
+        '''
         # TODO:[*] 20-03-24 注意若存在指定的 layer 需要有处理，目前是直接返回None，在外侧处理
-        if self.check_exist_layer(layer_name) is None:
-            if self.check_store(store_name):
-                # 创建 新的layer
-                # 1 动态生成 dict_meta
-                # 1.1
-                # dict_meta -> coverageview -> name
-                self.dict_meta.get('coverageview').update({'name': layer_name})
-
-                # dict_meta -> coverageview -> coverageBands -> coverageband_x
-                for k, v in self.dict_meta.get('coverageview').get('coverageBands').items():
-                    pass
-                pass
-                # 1.2 在 dict_meta -> + bands
-                for i, v in enumerate(bands):
-                    name = v.get('name')
-                    band_name_prefix = 'coverageband'
-                    # dict_meta -> coverageview -> coverageBands -> + coverageband_x
-                    band_name_temp = f'{band_name_prefix}_{i}'
-                    self.dict_meta.get('coverageview').get('coverageBands').update({
-                        band_name_temp: dict(
-                            definition=name,
-                            index=i,
-                            inputCoverageBands=dict(
-                                inputCoverageBand=dict(
-                                    coverageName=name
-                                )
-                            )
-                        )
-                    })
-                    # print(i, v)
-                    pass
-                # print(self.dict_meta)
-                try:
-                    self._generate_coverage_dict(layer_name, store_name, layer_name, layer_name, bands)
-                    is_do = True
-                except Exception as ex:
-                    is_do = False
-                    raise
-        else:
+        if self.check_exist_layer(layer_name) is not None:
             raise LayerError(layer_name)
-            # raise
-        return is_do
+        if self.check_store(store_name):
+            # 创建 新的layer
+            return self.build_coverage(layer_name, bands or [], store_name, title)
+        return None
 
-    def _generate_coverage_dict(self, layer_name: str, store_name: str, title: str = None, native_name: str = None,
-                                dimensions: List[Dict] = [],
-                                **kwargs):
+    def build_coverage(self, layer_name: str, bands: List[Dict[str, str]], store_name: str = None,
+                       title: str = None) -> dict:
         '''
-            动态生成 dict_coverage 字典 (all)
+            返回新建的 coverage 字典 (coverageview_xml 的参数)，不修改 dict_coverage / dict_meta
+            bands: [{'name': 'x_wind_10m'}, ...] 每个 band 对应一个 coverageBand 以及一个 coverageDimension
+                   可选的 description / range / type 用于 coverageDimension (默认为 [-inf, inf] 的 REAL_32BITS)，
+                   range 的值可以是字符串或数值
+                   可以由 netcdf.read_header(path).bands() 从本地 nc 文件的头部生成
         '''
-        try:
-            if title is None:
-                title = layer_name
-            if native_name is None:
-                native_name = layer_name
-            # dict_coverage -> name
-            self.dict_coverage.update({'name': layer_name})
-            # dict_coverage -> nativeName
-            self.dict_coverage.update({'nativeName': native_name})
-            # dict_coverage -> namespace
-            self.dict_coverage.update({'namespace': dict(
-                name=self.work_space,
-                atom=self.work_space
-            )})
-            # dict_coverage -> nativeCoverageName
-            self.dict_coverage.update({
-                'nativeCoverageName': native_name
-            })
-            # dict_coverage -> store
-            self.dict_coverage.update({
-                'store': dict(
-                    classname='coverageStore',
-                    name=f'{self.work_space}:{store_name}'
+        store_name = store_name or self.store_name
+        coverage_bands = {}
+        coverage_dimensions = {}
+        for i, band in enumerate(bands):
+            name = band.get('name')
+            coverage_bands[f'coverageband_{i}'] = dict(
+                definition=name,
+                index=i,
+                inputCoverageBands=dict(
+                    inputCoverageBand=dict(
+                        coverageName=name
+                    )
                 )
-            })
-
-            # dict_coverage -> metadata
-            self._update_metadata(native_name)
-            # dict_coverage -> dimensions
-            self._update_dimensions(dimensions)
-        except Exception as ex:
-            raise
+            )
+            # range 可以是数值 (如 [0, 1.5])，写入 xml 前统一转为字符串
+            coverage_dimensions[f'coverageDimension_{i}'] = CoverageDimensionMidModel(
+                name, str(band.get('description', 'GridSampleDimension[-Infinity,Infinity]')),
+                [str(v) for v in band.get('range', ['-inf', 'inf'])], str(band.get('type', 'REAL_32BITS')))
 
-    def _update_metadata(self, coverage_name: str):
-        '''
-            update -> metadata
-        '''
-        self.dict_coverage.update({'metadata': [
-            dict(
-                key='cachingEnabled',
-                name='entry',
-                tag='',
-                val='false'
-            ),
-            dict(
-                key='dirName',
-                name='entry',
-                tag='',
-                val=coverage_name
+        meta = dict(
+            coverageview=dict(
+                name=layer_name,
+                envelopeCompositionType='INTERSECTION',
+                selectedResolution='BEST',
+                selectedResolutionIndex='-1',
+                coverageBands=coverage_bands
+            )
+        )
+        return dict(
+            name=layer_name,
+            nativeName=layer_name,
+            namespace=dict(
+                name=self.work_space,
+                atom=self.work_space
             ),
-            dict(
-                key='COVERAGE_VIEW',
-                name='entry',
-                tag='',
-                val=self.dict_meta
+            title=title or layer_name,
+            description='Generated from NetCDF',
+            nativeCoverageName=layer_name,
+            enabled='true',
+            nativeFormat='NetCDF',
+            requestSRS=dict(string='EPSG:4326'),
+            responseSRS=dict(string='EPSG:4326'),
+            defaultInterpolationMethod='nearest neighbor',
+            metadata=[
+                dict(key='cachingEnabled', name='entry', tag='', val='false'),
+                dict(key='dirName', name='entry', tag='', val=layer_name),
+                dict(key='COVERAGE_VIEW', name='entry', tag='', val=meta),
+            ],
+            store=dict(
+                classname='coverageStore',
+                name=f'{self.work_space}:{store_name}'
             ),
-        ]})
+            dimensions=coverage_dimensions
+        )
 
-    def _update_dimensions(self, dimensions: List[Dict]):
+    def publish_many(self, jobs: Iterable[Tuple], concurrency: int = None) -> List[BulkResult]:
         '''
-            update -> dimensions
+            批量发布 layer
+            jobs: (store_name, layer_name, bands) 或 (store_name, layer_name, bands, title)
+            本 workspace 中已有的 layer (同 check_exist_layer) 与 coverage store 各只通过一次列表请求确定，
+            所有 coverage xml 在提交前生成，
+            再通过 catalog 的连接池并发(最多 concurrency 个，默认 catalog.concurrency)提交。
+            不会因为某个 layer 失败而中断: 对每个 job 返回一个 BulkResult(obj 为 layer_name)
         '''
-        coverage_dimension_prefix = 'coverageDimension'
-        coverage_dimension_dict = {}
-        for k, v in enumerate(dimensions):
-            coverage_dimension_dict.update({
-                f'{coverage_dimension_prefix}_{k}': CoverageDimensionMidModel(v.get('name'),
-                                                                              'GridSampleDimension[-Infinity,Infinity]',
-                                                                              ['-inf', 'inf'], 'REAL_32BITS')
-            })
-        self.dict_coverage.update({
-            'dimensions': coverage_dimension_dict
-        })
+        service_url = self.catalog.service_url
+        layers_url = build_url(service_url, ['workspaces', self.work_space, 'layers.xml'])
+        layers = self.catalog.get_xml(layers_url)
+        existing_layers = set(node.findtext('name') for node in layers.findall('layer'))
+        stores = self.catalog.get_xml(build_url(service_url, ['workspaces', self.work_space, 'coveragestores.xml']))
+        existing_stores = set(node.findtext('name') for node in stores.findall('coverageStore'))
+
+        results = []
+        requests_to_send = []
+        for job in jobs:
+            store_name, layer_name, bands = job[:3]
+            title = job[3] if len(job) > 3 else None
+            result = BulkResult(layer_name)
+            results.append(result)
+            if layer_name in existing_layers:
+                result.error = LayerError(layer_name)
+                continue
+            if store_name not in existing_stores:
+                result.error = GeoServerError(f'coverage store {self.work_space}:{store_name} 不存在')
+                continue
+            existing_layers.add(layer_name)
+            try:
+                coverage = self.build_coverage(layer_name, bands, store_name, title)
+                msg = self._msg(coverage)
+            except Exception as ex:
+                result.error = ex
+                continue
+            url = build_url(service_url, ['workspaces', self.work_space, 'coveragestores', store_name, 'coverages'])
+            requests_to_send.append((result, url, msg))
+
+        def post(item):
+            result, url, msg = item
+            try:
+                result.response = self.catalog.http_request(url, method='post', data=msg,
+                                                            headers={'Content-type': 'text/xml'})
+                if result.response.status_code not in [200, 201]:
+                    result.error = GeoServerError(
+                        f'发布 layer {result.obj} 失败: {result.response.status_code}, {result.response.text}')
+            except Exception as ex:
+                result.error = ex
+
+        self.catalog.map(post, requests_to_send, concurrency)
+        for result, url, _ in requests_to_send:
+            if result.ok:
+                self.catalog.invalidate_cache(url, 'coverage')
+        if requests_to_send:
+            # 下一批据此列表判断 layer 是否已存在; 失败(如超时)的 POST 也可能已经创建了 layer
+            self.catalog.invalidate_cache(layers_url)
+        return results
 
     def check_exist_layer(self, name: str):
         '''
-            判断是否存在指定名称的 layer
+            判断本 workspace 中是否存在指定名称的 layer
+            与 publish_many 一致: 其他 workspace 中的同名 layer 不影响发布
         '''
-        return self.catalog.get_layer(name)
+        return self.catalog.get_layer(f'{self.work_space}:{name}')
         pass
 
     def check_store(self, name: str):
@@ -246,14 +276,17 @@ class CoverageLayer:
         '''
         headers_xml = {'content-type': 'text/xml'}
         try:
-            if self._create_layer(layer_name, self.store_name, title if title else layer_name, bands):
+            coverage = self._create_layer(layer_name, self.store_name, title if title else layer_name, bands)
+            if coverage is not None:
                 '''
                      NOTE: 错误汇总:
                         1- 400错误:No such layer: nmefc_wind
                 '''
 
-                response = requests.post(self.href, auth=('admin', 'geoserver'), data=self.msg, headers=headers_xml)
+                response = self.catalog.http_request(self.href, method='post', data=self._msg(coverage),
+                                                     headers=headers_xml)
                 if response.status_code in [200, 201]:
+                    self.catalog.invalidate_cache(self.href, 'coverage')
                     return response
                 # else:
                 #     raise
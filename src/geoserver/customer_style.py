@@ -1,4 +1,3 @@
-import requests
 from geoserver.catalog import Catalog
 
 # class Style:
@@ -35,15 +34,21 @@ def bind_layer_style(cat: Catalog, layer_name: str, style_name: str, coverage_ti
         # 'http://localhost:8080/geoserver/rest//workspaces/my_test_2/layers/ceshi_coverage_01'
         # TODO:[-] 20-03-26 注意此部分需要去掉工作区(之前是要包含工作区的),03-30 更新，修改版本为 2.15.1
         url_style = f'{cat.service_url}/workspaces/{work_space}/layers/{coverage_title}'
-        response = requests.put(
-            url_style,
-            auth=(cat.username, cat.password),
-            data=json_data,
-            headers=headers_xml)
-        pass
+        response = cat.http_request(url_style, method='put', data=json_data, headers=headers_xml)
+        if response.status_code in [200, 201]:
+            _invalidate_layer(cat, work_space, coverage_title)
         # print(response)
 
 
+def _invalidate_layer(cat: Catalog, work_space: str, layer_name: str):
+    '''
+        修改 layer 后清除其缓存 (workspace 下的 layer 以及 /layers 下带/不带工作区前缀的 layer)
+    '''
+    cat.invalidate_cache(f'{cat.service_url}/workspaces/{work_space}/layers/{layer_name}.xml', 'layer')
+    cat.invalidate_cache(f'{cat.service_url}/layers/{work_space}:{layer_name}.xml', 'layer')
+    cat.invalidate_cache(f'{cat.service_url}/layers/{layer_name}.xml', 'layer')
+
+
 def check_style(cat: Catalog, style_name: str, work_space_name: str):
     '''
         判断指定工作区下是否包含指定的 style
@@ -144,12 +149,9 @@ class LayerStyle(BaseStyle):
             # 'http://localhost:8080/geoserver/rest//workspaces/my_test_2/layers/ceshi_coverage_01'
             # TODO:[-] 20-03-26 注意此部分需要去掉工作区(之前是要包含工作区的),03-30 更新，修改版本为 2.15.1
             url_style = f'{self.cat.service_url}/workspaces/{self.work_space.name}/layers/{coverage_title}'
-            response = requests.put(
-                url_style,
-                auth=(self.cat.username, self.cat.password),
-                data=json_data,
-                headers=headers_xml)
+            response = self.cat.http_request(url_style, method='put', data=json_data, headers=headers_xml)
             if response.status_code in [200, 201]:
+                _invalidate_layer(self.cat, self.work_space.name, coverage_title)
                 is_ok = True
         return is_ok
 
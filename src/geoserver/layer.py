@@ -120,11 +120,17 @@ class Layer(ResourceInfo):
         # TODO:[-] 在所有实现类的构造函数中定义 catalog
         self.catalog = catalog
         self.name = name
-        self.gs_version = self.catalog.get_short_version()
 
     resource_type = "layer"
     save_method = "PUT"
 
+    @property
+    def gs_version(self):
+        '''
+            the short geoserver version, requested lazily (once per catalog)
+        '''
+        return self.catalog.get_short_version()
+
     @property
     def href(self):
         return "{}/layers/{}.xml".format(self.catalog.service_url, self.name)
@@ -133,16 +139,20 @@ class Layer(ResourceInfo):
     def resource(self):
         '''
             TODO:[*] 何用？ 我的理解layer里面没有msg，有reources
+            The published resource (see Catalog.get_resource): None if it does not
+            exist (this used to raise IndexError), AmbiguousRequestError if the name
+            matches more than one resource.
         '''
         if self.dom is None:
             self.fetch()
         name = self.dom.find("resource/name").text
-        atom_link = [n for n in self.dom.find("resource").getchildren() if 'href' in n.attrib]
+        atom_link = [n for n in self.dom.find("resource") if 'href' in n.attrib]
         ws_name = workspace_from_url(atom_link[0].get('href'))
-        if self.gs_version >= "2.13":
+        if self.catalog.get_version_info() >= (2, 13):
             if ":" in name:
                 ws_name, name = name.split(':')
-        return self.catalog.get_resources(names=name, workspaces=ws_name)[0]
+        # 有 workspace 时直接请求 workspace 下的 resource，不再遍历所有 store
+        return self.catalog.get_resource(name, workspace=ws_name)
 
     def _get_default_style(self):
         if 'default_style' in self.dirty:
@@ -159,10 +169,10 @@ class Layer(ResourceInfo):
         else:
             style_name = element.find('name').text
             ws_name = None
-        atom_link = [n for n in element.getchildren() if 'href' in n.attrib]
+        atom_link = [n for n in element if 'href' in n.attrib]
         if atom_link and ws_name is None:
             ws_name = workspace_from_url(atom_link[0].get("href"))
-        return self.catalog.get_styles(names=style_name, workspaces=ws_name)[0]
+        return self.catalog.resolve_style(style_name, workspace=ws_name)
 
     def _set_default_style(self, style):
         if isinstance(style, Style):
@@ -236,11 +246,23 @@ class CoverageLayer(Layer):
                    ! 此时暂时放弃掉重写 layer 的这种思路，改为直接将需要提交的 data ，放在catalog.py -> def: create_coverageNcStore中(见其中todo)
     '''
 
-    def __init__(self, catalog: Catalog, name: str, nativeName: str, title: str, nativeCVoverageName: str):
+    # 默认的 bbox 以及 grid (见 netcdf.NetCDFHeader.bbox / grid)
+    default_bbox = ('99.9', '150.10000000000002', '-0.1', '50.1', 'EPSG:4326')
+    default_grid = dict(low='0 0', high='251 251', scaleX='0.2', scaleY='-0.2', translateX='100.0',
+                        translateY='50.0', crs='EPSG:4326')
+
+    def __init__(self, catalog: Catalog, name: str, nativeName: str, title: str, nativeCVoverageName: str,
+                 bbox: tuple = None, grid: dict = None):
+        '''
+            bbox, grid: 可由 netcdf.read_header(path) 从本地 nc 文件的头部读取，默认为 default_bbox / default_grid
+        '''
         super().__init__(catalog, name)
         self.nativeName = nativeName
         self.title = title
         self.nativeCVoverageName = nativeCVoverageName
+        # bbox / grid 的值可以是数值, 统一转为字符串
+        self.bbox = tuple(str(v) for v in bbox or self.default_bbox)
+        self.grid = {k: str(v) for k, v in (grid or self.default_grid).items()}
         root_node = (
             {'key': 'name', 'val': self.name}
         )
@@ -272,6 +294,8 @@ class CoverageLayer(Layer):
             先创建一个基础的 xml 然后向其中插入动态的节点数据，先去掉所有的动态数据的节点
 
         '''
+        minx, maxx, miny, maxy, crs = self.bbox
+        grid = self.grid
         base_xml_str = f'''
                     <coverage>
   <namespace>
@@ -284,18 +308,18 @@ class CoverageLayer(Layer):
   <nativeCRS>GEOGCS["WGS 84", DATUM["World Geodetic System 1984", SPHEROID["WGS 84", 6378137.0, 298.257223563, AUTHORITY["EPSG","7030"]], AUTHORITY["EPSG","6326"]], PRIMEM["Greenwich", 0.0, AUTHORITY["EPSG","8901"]], UNIT["degree", 0.017453292519943295], AXIS["Geodetic longitude", EAST], AXIS["Geodetic latitude", NORTH], AUTHORITY["EPSG","4326"]]</nativeCRS>
   <srs>EPSG:4326</srs>
   <nativeBoundingBox>
-    <minx>99.9</minx>
-    <maxx>150.10000000000002</maxx>
-    <miny>-0.1</miny>
-    <maxy>50.1</maxy>
-    <crs>EPSG:4326</crs>
+    <minx>{minx}</minx>
+    <maxx>{maxx}</maxx>
+    <miny>{miny}</miny>
+    <maxy>{maxy}</maxy>
+    <crs>{crs}</crs>
   </nativeBoundingBox>
   <latLonBoundingBox>
-    <minx>99.9</minx>
-    <maxx>150.10000000000002</maxx>
-    <miny>-0.1</miny>
-    <maxy>50.1</maxy>
-    <crs>EPSG:4326</crs>
+    <minx>{minx}</minx>
+    <maxx>{maxx}</maxx>
+    <miny>{miny}</miny>
+    <maxy>{maxy}</maxy>
+    <crs>{crs}</crs>
   </latLonBoundingBox>
   <projectionPolicy>REPROJECT_TO_DECLARED</projectionPolicy>
   <enabled>true</enabled>
@@ -317,18 +341,18 @@ class CoverageLayer(Layer):
   <nativeFormat>NetCDF</nativeFormat>
   <grid dimension="2">
     <range>
-      <low>0 0</low>
-      <high>251 251</high>
+      <low>{grid['low']}</low>
+      <high>{grid['high']}</high>
     </range>
     <transform>
-      <scaleX>0.2</scaleX>
-      <scaleY>-0.2</scaleY>
+      <scaleX>{grid['scaleX']}</scaleX>
+      <scaleY>{grid['scaleY']}</scaleY>
       <shearX>0.0</shearX>
       <shearY>0.0</shearY>
-      <translateX>100.0</translateX>
-      <translateY>50.0</translateY>
+      <translateX>{grid['translateX']}</translateX>
+      <translateY>{grid['translateY']}</translateY>
     </transform>
-    <crs>EPSG:4326</crs>
+    <crs>{grid['crs']}</crs>
   </grid>
   <supportedFormats>
     <string>GEOTIFF</string>
@@ -0,0 +1,428 @@
+'''
+gsconfig is a python library for manipulating a GeoServer instance via the GeoServer RESTConfig API.
+
+The project is distributed under a MIT License .
+'''
+
+__author__ = "David Winslow"
+__copyright__ = "Copyright 2012-2018 Boundless, Copyright 2010-2012 OpenPlans"
+__license__ = "MIT"
+
+import struct
+from collections import OrderedDict
+
+from mid_model import CoverageDimensionMidModel
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+# classic format nc_type -> (struct format, type name)
+_NC_TYPES = {
+    1: ('b', 'byte'),
+    2: ('c', 'char'),
+    3: ('h', 'short'),
+    4: ('i', 'int'),
+    5: ('f', 'float'),
+    6: ('d', 'double'),
+    7: ('B', 'ubyte'),
+    8: ('H', 'ushort'),
+    9: ('I', 'uint'),
+    10: ('q', 'int64'),
+    11: ('Q', 'uint64'),
+}
+
+_NC_DIMENSION, _NC_VARIABLE, _NC_ATTRIBUTE = 10, 11, 12
+_STREAMING = 0xFFFFFFFF
+
+# type name -> GeoServer dimensionType (GeoServer has no 64 bits integer sample type)
+_DIMENSION_TYPES = {
+    'byte': 'SIGNED_8BITS',
+    'ubyte': 'UNSIGNED_8BITS',
+    'short': 'SIGNED_16BITS',
+    'ushort': 'UNSIGNED_16BITS',
+    'int': 'SIGNED_32BITS',
+    'uint': 'UNSIGNED_32BITS',
+    'float': 'REAL_32BITS',
+    'double': 'REAL_64BITS',
+    'int64': 'REAL_64BITS',
+    'uint64': 'REAL_64BITS',
+}
+
+# how the CF conventions identify the longitude (X) and latitude (Y) coordinates
+_AXES = {
+    'X': (('lon', 'longitude'), ('degrees_east', 'degree_east', 'degrees_e', 'degree_e')),
+    'Y': (('lat', 'latitude'), ('degrees_north', 'degree_north', 'degrees_n', 'degree_n')),
+}
+
+UNBOUNDED_RANGE = ['-inf', 'inf']
+UNBOUNDED_DESCRIPTION = 'GridSampleDimension[-Infinity,Infinity]'
+
+
+def _format_number(value, type_name):
+    '''
+        value as the string GeoServer expects, float32 values in their shortest
+        round-tripping form (0.1 rather than 0.10000000149011612)
+    '''
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if isinstance(value, str):
+        return value.strip()
+    if type_name != 'float' or value != value or value in (float('inf'), float('-inf')):
+        return str(value)
+    packed = struct.pack('>f', value)
+    for precision in range(1, 10):
+        text = '%.*g' % (precision, value)
+        if struct.pack('>f', float(text)) == packed:
+            return text
+    return repr(value)
+
+
+class NetCDFVariable(object):
+    '''
+        A variable of a NetCDF header.
+        dimensions: the names of its dimensions, shape: their lengths
+        type_name:  byte, char, short, int, float, double, ubyte, ushort, uint, int64 or uint64
+        begin:      the file offset of its data (classic format only)
+        record:     True if it varies along the unlimited dimension
+    '''
+    __slots__ = ('name', 'dimensions', 'shape', 'attributes', 'type_name', 'begin', 'record')
+
+    def __init__(self, name, dimensions, shape, attributes, type_name, begin=None, record=False):
+        self.name = name
+        self.dimensions = dimensions
+        self.shape = shape
+        self.attributes = attributes
+        self.type_name = type_name
+        self.begin = begin
+        self.record = record
+
+    def __repr__(self):
+        return "NetCDFVariable(%s %s%s)" % (self.type_name, self.name, self.dimensions)
+
+    @property
+    def is_coordinate(self):
+        return self.dimensions == (self.name,)
+
+    def axis(self):
+        '''
+            'X' or 'Y' if this is a longitude / latitude coordinate variable, else None
+        '''
+        if not self.is_coordinate:
+            return None
+        axis = self.attributes.get('axis')
+        if axis in _AXES:
+            return axis
+        units = str(self.attributes.get('units', '')).lower()
+        standard_name = self.attributes.get('standard_name')
+        for axis, (names, axis_units) in _AXES.items():
+            if self.name.lower() in names or standard_name in names or units in axis_units:
+                return axis
+        return None
+
+    def value_range(self):
+        '''
+            [min, max] as strings, from the valid_range, valid_min / valid_max or
+            actual_range attributes, or ['-inf', 'inf'] if none is set
+        '''
+        attributes = self.attributes
+        for key in ('valid_range', 'actual_range'):
+            value = attributes.get(key)
+            if isinstance(value, tuple) and len(value) == 2:
+                return [_format_number(v, self.type_name) for v in value]
+        if 'valid_min' in attributes or 'valid_max' in attributes:
+            return [
+                _format_number(attributes['valid_min'], self.type_name) if 'valid_min' in attributes else '-inf',
+                _format_number(attributes['valid_max'], self.type_name) if 'valid_max' in attributes else 'inf'
+            ]
+        return list(UNBOUNDED_RANGE)
+
+    def coverage_dimension(self):
+        '''
+            The CoverageDimensionMidModel GeoServer describes this variable with
+        '''
+        value_range = self.value_range()
+        if value_range == UNBOUNDED_RANGE:
+            description = UNBOUNDED_DESCRIPTION
+        else:
+            description = 'GridSampleDimension[%s,%s]' % tuple(value_range)
+        return CoverageDimensionMidModel(self.name, description, value_range,
+                                         _DIMENSION_TYPES.get(self.type_name, 'REAL_64BITS'))
+
+
+class _HeaderReader(object):
+    '''
+        Reads the header of a classic (CDF-1), 64 bit offset (CDF-2) or
+        64 bit data (CDF-5) file from its start, one field at a time.
+    '''
+
+    def __init__(self, f, version):
+        self.f = f
+        # CDF-5 stores element counts as 64 bits integers, CDF-2 and CDF-5 store 64 bits offsets
+        self.count = '>q' if version == 5 else '>i'
+        self.offset = '>i' if version == 1 else '>q'
+
+    def read(self, size):
+        data = self.f.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated NetCDF header in %s" % getattr(self.f, 'name', self.f))
+        return data
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def padded(self, size):
+        data = self.read(size)
+        self.read(-size % 4)
+        return data
+
+    def name(self):
+        return self.padded(self.unpack(self.count)).decode('utf-8')
+
+    def nc_type(self):
+        nc_type = self.unpack('>i')
+        if nc_type not in _NC_TYPES:
+            raise ValueError("Unknown NetCDF type %d" % nc_type)
+        return _NC_TYPES[nc_type]
+
+    def list_header(self, tag):
+        '''the number of elements of a dimension, attribute or variable list'''
+        found = self.unpack('>i')
+        count = self.unpack(self.count)
+        if found not in (0, tag) or (found == 0 and count != 0):
+            raise ValueError("Malformed NetCDF header")
+        return count
+
+    def attributes(self):
+        attributes = OrderedDict()
+        for _ in range(self.list_header(_NC_ATTRIBUTE)):
+            name = self.name()
+            code, type_name = self.nc_type()
+            count = self.unpack(self.count)
+            data = self.padded(count * struct.calcsize(code))
+            if type_name == 'char':
+                attributes[name] = data.rstrip(b'\x00').decode('utf-8', 'replace')
+            else:
+                values = struct.unpack('>%d%s' % (count, code), data)
+                attributes[name] = values[0] if count == 1 else values
+        return attributes
+
+
+class NetCDFHeader(object):
+    '''
+    The header of a local NetCDF file: its dimensions, global attributes and
+    variables, read without loading any variable data.
+
+    Classic, 64 bit offset and 64 bit data files (CDF-1, CDF-2, CDF-5) are
+    parsed here; NetCDF-4 (HDF5) files need the optional netCDF4 package.
+    The only data ever read are the first and last values of the longitude and
+    latitude coordinate variables, when bbox or grid is first asked for.
+
+    Use read_header(path) to build one.
+    '''
+
+    def __init__(self, path, file_format, dimensions, attributes, variables, unlimited=None):
+        self.path = path
+        self.file_format = file_format
+        # dimension name -> length (the number of records for the unlimited dimension)
+        self.dimensions = dimensions
+        self.attributes = attributes
+        self.variables = variables
+        self.unlimited = unlimited
+        self._extent = None
+
+    def __repr__(self):
+        return "NetCDFHeader(%s, %s, %s)" % (self.path, self.file_format, list(self.variables))
+
+    def coordinate(self, axis):
+        '''
+            The 'X' (longitude) or 'Y' (latitude) coordinate variable, None if there is none
+        '''
+        for variable in self.variables.values():
+            if variable.axis() == axis:
+                return variable
+        return None
+
+    def band_variables(self):
+        '''
+            The variables GeoServer can publish as bands: those laid out on the
+            longitude / latitude grid, other than the coordinates themselves.
+        '''
+        x, y = self.coordinate('X'), self.coordinate('Y')
+        if x is None or y is None:
+            return []
+        grid = {x.name, y.name}
+        return [v for v in self.variables.values()
+                if not v.is_coordinate and v.type_name != 'char' and grid.issubset(v.dimensions)]
+
+    def _variables(self, names):
+        if names is None:
+            return self.band_variables()
+        return [self.variables[name] for name in names]
+
+    def bands(self, names=None):
+        '''
+            The bands argument of customer_layer.CoverageLayer.publish / build_coverage
+            for the named variables (by default every band_variables()), with the
+            description, range and type of their coverageDimension.
+        '''
+        bands = []
+        for variable in self._variables(names):
+            dimension = variable.coverage_dimension()
+            bands.append(dict(name=variable.name, description=dimension.des, range=dimension.range,
+                              type=dimension.type))
+        return bands
+
+    def coverage_dimensions(self, names=None):
+        return [v.coverage_dimension() for v in self._variables(names)]
+
+    def _coordinate_ends(self, variable):
+        '''the first and last values of a 1-D coordinate variable'''
+        code = next(code for code, type_name in _NC_TYPES.values() if type_name == variable.type_name)
+        size = struct.calcsize(code)
+        values = []
+        with open(self.path, 'rb') as f:
+            for index in (0, variable.shape[0] - 1):
+                f.seek(variable.begin + index * size)
+                values.append(struct.unpack('>' + code, f.read(size))[0])
+        return values
+
+    def _axis_extent(self, axis):
+        '''(count, first value, last value, resolution) along axis, None if unknown'''
+        variable = self.coordinate(axis)
+        if variable is None or variable.record or not variable.shape[0]:
+            return None
+        count = variable.shape[0]
+        first, last = self._coordinate_ends(variable)
+        resolution = abs(last - first) / (count - 1) if count > 1 else 0.0
+        return count, float(first), float(last), resolution
+
+    def _extents(self):
+        if self._extent is None:
+            self._extent = (self._axis_extent('X'), self._axis_extent('Y'))
+        return self._extent
+
+    @property
+    def bbox(self):
+        '''
+            (minx, maxx, miny, maxy, crs) of the pixel edges, as strings (see
+            support.bbox), or None if the file has no longitude / latitude coordinates.
+            Like GeoServer, the grid is assumed to be regular.
+        '''
+        x, y = self._extents()
+        if x is None or y is None:
+            return None
+        box = []
+        for _, first, last, resolution in (x, y):
+            box.append(str(min(first, last) - resolution / 2))
+            box.append(str(max(first, last) + resolution / 2))
+        return tuple(box) + ('EPSG:4326',)
+
+    @property
+    def grid(self):
+        '''
+            The grid of the coverage as GeoServer describes it: the range of the
+            pixels (low, high) and the affine transform to the pixel centers,
+            None if the file has no longitude / latitude coordinates.
+        '''
+        x, y = self._extents()
+        if x is None or y is None:
+            return None
+        return dict(
+            low='0 0',
+            high='%d %d' % (x[0], y[0]),
+            scaleX=str(x[3]),
+            scaleY=str(-y[3]),
+            translateX=str(min(x[1], x[2])),
+            translateY=str(max(y[1], y[2])),
+            crs='EPSG:4326'
+        )
+
+
+class _NetCDF4Header(NetCDFHeader):
+    '''A NetCDF-4 (HDF5) header read through the netCDF4 package'''
+
+    def _coordinate_ends(self, variable):
+        with netCDF4.Dataset(self.path) as dataset:
+            values = dataset.variables[variable.name]
+            return [values[0].item(), values[-1].item()]
+
+
+def _read_classic(path, f, version):
+    reader = _HeaderReader(f, version)
+    numrecs = reader.unpack(reader.count)
+
+    dimensions = OrderedDict()
+    unlimited = None
+    for _ in range(reader.list_header(_NC_DIMENSION)):
+        name = reader.name()
+        length = reader.unpack(reader.count)
+        if length == 0:
+            unlimited = name
+        dimensions[name] = length
+    names = list(dimensions)
+    attributes = reader.attributes()
+
+    variables = OrderedDict()
+    for _ in range(reader.list_header(_NC_VARIABLE)):
+        name = reader.name()
+        dimension_names = tuple(names[reader.unpack(reader.count)] for _ in range(reader.unpack(reader.count)))
+        variable_attributes = reader.attributes()
+        _, type_name = reader.nc_type()
+        reader.unpack(reader.count)  # vsize
+        begin = reader.unpack(reader.offset)
+        variables[name] = NetCDFVariable(name, dimension_names, None, variable_attributes, type_name, begin,
+                                         record=unlimited is not None and unlimited in dimension_names[:1])
+
+    if unlimited is not None:
+        dimensions[unlimited] = None if numrecs == _STREAMING else numrecs
+    for variable in variables.values():
+        variable.shape = tuple(dimensions[d] for d in variable.dimensions)
+    return NetCDFHeader(path, 'CDF-%d' % version, dimensions, attributes, variables, unlimited)
+
+
+def _read_netcdf4(path):
+    if netCDF4 is None:
+        raise ImportError("Reading NetCDF-4 (HDF5) files requires netCDF4, install it with: pip install gsconfig[netcdf4]")
+
+    def type_name(dtype):
+        if dtype.kind in 'SUO':
+            return 'char'
+        return {'i1': 'byte', 'u1': 'ubyte', 'i2': 'short', 'u2': 'ushort', 'i4': 'int', 'u4': 'uint',
+                'f4': 'float', 'f8': 'double', 'i8': 'int64', 'u8': 'uint64'}.get(dtype.str[1:], 'double')
+
+    def attribute(value):
+        # numpy scalars and arrays -> python numbers and tuples like the classic reader
+        if hasattr(value, 'tolist'):
+            value = value.tolist()
+            return tuple(value) if isinstance(value, list) and len(value) != 1 else \
+                (value[0] if isinstance(value, list) else value)
+        return value
+
+    with netCDF4.Dataset(path) as dataset:
+        dimensions = OrderedDict((name, len(d)) for name, d in dataset.dimensions.items())
+        unlimited = next((name for name, d in dataset.dimensions.items() if d.isunlimited()), None)
+        attributes = OrderedDict((k, attribute(dataset.getncattr(k))) for k in dataset.ncattrs())
+        variables = OrderedDict()
+        for name, v in dataset.variables.items():
+            variables[name] = NetCDFVariable(
+                name, tuple(v.dimensions), tuple(v.shape),
+                OrderedDict((k, attribute(v.getncattr(k))) for k in v.ncattrs()),
+                type_name(v.dtype), record=unlimited in v.dimensions[:1])
+        return _NetCDF4Header(path, dataset.data_model, dimensions, attributes, variables, unlimited)
+
+
+def read_header(path):
+    '''
+        Reads the header of the NetCDF file at path, see NetCDFHeader.
+        Raises ValueError if path is not a NetCDF file, and ImportError for a
+        NetCDF-4 file when netCDF4 is not installed.
+    '''
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+        if magic[:3] == b'CDF' and magic[3:] in (b'\x01', b'\x02', b'\x05'):
+            return _read_classic(path, f, magic[3])
+    if magic == b'\x89HDF':
+        return _read_netcdf4(path)
+    raise ValueError("%s is not a NetCDF file" % path)
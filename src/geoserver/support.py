@@ -11,9 +11,10 @@ __license__ = "MIT"
 import logging
 from xml.etree.ElementTree import TreeBuilder, tostring
 from tempfile import mkstemp
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED, ZIP64_LIMIT
 import os
 import abc
+import time
 # 新加入的
 from abc import abstractclassmethod, abstractmethod
 from typing import Callable
@@ -347,6 +348,181 @@ def prepare_upload_bundle(name, data):
     return path
 
 
+class UploadStream(object):
+    """A read-only file wrapper used as a request body, so uploads are streamed
+    from disk in chunks instead of being read into memory first.
+
+    source is a path or a binary file-like object; a path is opened (and closed)
+    by the stream. progress, if given, is called as progress(bytes_sent, total)
+    after every chunk. bytes_sent, elapsed and throughput (bytes per second)
+    describe the upload so far and are logged once the body has been sent.
+    seek/tell let the transport rewind the body before retrying a request."""
+
+    def __init__(self, source, progress=None):
+        if isinstance(source, basestring):
+            self._file = open(source, 'rb')
+            self._owned = True
+            self.name = source
+        else:
+            self._file = source
+            self._owned = False
+            self.name = getattr(source, 'name', None)
+        self.progress = progress
+        self._start = self._file.tell()
+        self._file.seek(0, os.SEEK_END)
+        self.total = self._file.tell() - self._start
+        self._file.seek(self._start)
+        self.bytes_sent = 0
+        self.started = None
+        self.finished = None
+
+    def __len__(self):
+        return self.total
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def read(self, size=-1):
+        if self.started is None:
+            self.started = time.monotonic()
+        chunk = self._file.read(size)
+        self.bytes_sent += len(chunk)
+        if chunk and self.progress is not None:
+            self.progress(self.bytes_sent, self.total)
+        if self.bytes_sent >= self.total and self.finished is None:
+            self.finished = time.monotonic()
+            logger.debug("Sent %s: %d bytes in %.2fs (%.0f bytes/s)",
+                         self.name, self.bytes_sent, self.elapsed, self.throughput)
+        return chunk
+
+    def tell(self):
+        return self._file.tell() - self._start
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            offset += self._start
+        position = self._file.seek(offset, whence)
+        self.bytes_sent = self.tell()
+        self.finished = None
+        return position
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self):
+        elapsed = self.elapsed
+        return self.bytes_sent / elapsed if elapsed > 0 else 0.0
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+
+
+# extensions of formats that are already compressed, stored as is in upload bundles
+COMPRESSED_EXTENSIONS = frozenset([
+    'zip', 'gz', 'tgz', 'bz2', 'xz', '7z', 'jpg', 'jpeg', 'png', 'gif', 'jp2', 'j2k', 'webp', 'ecw', 'sid',
+])
+
+
+class _ZipSink(object):
+    """Write-only, unseekable target for a ZipFile: the written bytes are
+    collected until drained. ZipFile then writes data descriptors after each
+    entry instead of seeking back to patch the local headers."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class UploadBundle(object):
+    """The ZIP archive prepare_upload_bundle would write (see there for the
+    layout GeoServer expects), generated on the fly while it is iterated instead
+    of in a temporary file. Used as a request body it is sent with chunked
+    transfer encoding; iterating it again (eg: when a request is retried)
+    builds the archive again, rewinding seekable file-like sources.
+
+    data maps extensions to paths or binary file-like objects. Entries are
+    stored uncompressed when compresslevel is None (as prepare_upload_bundle
+    does) or when their extension is in COMPRESSED_EXTENSIONS; the others are
+    deflated at compresslevel (0-9). progress, if given, is called as
+    progress(bytes_sent, None) after every chunk: the total is not known up front."""
+
+    def __init__(self, name, data, compresslevel=None, chunk_size=1024 * 1024, progress=None):
+        self.name = name
+        self.data = data
+        self.compresslevel = compresslevel
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.bytes_sent = 0
+        self._positions = dict((ext, stream.tell()) for ext, stream in data.items()
+                               if not isinstance(stream, basestring) and _seekable(stream))
+
+    def __iter__(self):
+        self.bytes_sent = 0
+        sink = _ZipSink()
+        compression = ZIP_STORED if self.compresslevel is None else ZIP_DEFLATED
+        with ZipFile(sink, 'w', compression, compresslevel=self.compresslevel) as zip_file:
+            for ext, stream in self.data.items():
+                fname = "%s.%s" % (self.name, ext)
+                is_path = isinstance(stream, basestring)
+                if is_path:
+                    size = os.path.getsize(stream)
+                    stream = open(stream, 'rb')
+                else:
+                    size = None
+                    if ext in self._positions:
+                        stream.seek(self._positions[ext])
+                try:
+                    zip_file.compression = ZIP_STORED if ext.lower() in COMPRESSED_EXTENSIONS else compression
+                    force_zip64 = size is None or size * 1.05 > ZIP64_LIMIT
+                    with zip_file.open(fname, 'w', force_zip64=force_zip64) as entry:
+                        while True:
+                            block = stream.read(self.chunk_size)
+                            if not block:
+                                break
+                            entry.write(block)
+                            chunk = sink.drain()
+                            if chunk:
+                                yield self._sent(chunk)
+                finally:
+                    if is_path:
+                        stream.close()
+        chunk = sink.drain()
+        if chunk:
+            yield self._sent(chunk)
+
+    def _sent(self, chunk):
+        self.bytes_sent += len(chunk)
+        if self.progress is not None:
+            self.progress(self.bytes_sent, None)
+        return chunk
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except AttributeError:
+        return hasattr(stream, 'seek') and hasattr(stream, 'tell')
+
+
 def atom_link(node):
     if 'href' in node.attrib:
         return node.attrib['href']
@@ -385,6 +561,12 @@ def bbox_xml(builder, box):
         builder.end("crs")
 
 
+# lower case keys of the coverage / coverageView nodes written as plain text
+_COVERAGE_TEXT_KEYS = frozenset(['enabled', 'nativeformat', 'defaultinterpolationmethod'])
+_COVERAGE_SRS_KEYS = frozenset(['requestsrs', 'responsesrs'])
+_COVERAGEVIEW_TEXT_KEYS = frozenset(['name', 'envelopecompositiontype', 'selectedresolution', 'selectedresolutionindex'])
+
+
 def coverageview_xml(info: dict):
     '''
         用来创建 coverageview 的 xml builder
@@ -392,7 +574,7 @@ def coverageview_xml(info: dict):
     # TODO:[*] 20-03-18 可能引发错误
     # xml.etree.ElementTree.ParseError: multiple elements on top level
     root = TreeBuilder()
-    root.start('coverage')
+    root.start('coverage', dict())
     for father_k, father_v in info.items():
         # 几个固定的
         if father_k.lower() == 'name':
@@ -425,16 +607,16 @@ def coverageview_xml(info: dict):
             covreageview_dimensions_info(root, father_v, name='dimensions')
             pass
         # TODO:[-] + 20-03-19 新增的部分
-        elif father_k.lower() in [temp.lower() for temp in ['enabled', 'nativeFormat', 'defaultInterpolationMethod']]:
-            root.start(father_k)
+        elif father_k.lower() in _COVERAGE_TEXT_KEYS:
+            root.start(father_k, dict())
             root.data(father_v)
             root.end(father_k)
         # 里面是嵌套的字典
-        elif father_k.lower() in [temp.lower() for temp in ['requestSRS', 'responseSRS']]:
-            root.start(father_k)
+        elif father_k.lower() in _COVERAGE_SRS_KEYS:
+            root.start(father_k, dict())
             if isinstance(father_v, dict):
                 for k, v in father_v.items():
-                    root.start(k)
+                    root.start(k, dict())
                     root.data(v)
                     root.end(k)
             root.end(father_k)
@@ -459,14 +641,14 @@ def coverageview_namespace_info(builder: TreeBuilder, info: dict, name: str = No
     '''
     if isinstance(info, dict):
         if name is not None:
-            builder.start(name)
+            builder.start(name, dict())
         for k, v in info.items():
             if k.lower() == 'name':
-                builder.start(k)
+                builder.start(k, dict())
                 builder.data(v)
                 builder.end(k)
             elif k.lower() == 'atom':
-                builder.start(k)
+                builder.start(k, dict())
                 builder.data(v)
                 builder.end(k)
         if name is not None:
@@ -482,7 +664,7 @@ def coverageview_meta_info(builder: TreeBuilder, metadata: List[dict], name: str
     if isinstance(metadata, list):
         # 目前存在的问题是 由于存在 coverageBands 是一个 coverageBand的数组，
         # 创建 coverage stores -> data -> coverage(root) -> [+]  metadata -> entry :key='coverage_view' ->  coverageview
-        builder.start('metadata')
+        builder.start('metadata', dict())
         # 下面需要改为循环一个数组
         for v in metadata:
             # if 'key' in v.items():
@@ -492,19 +674,17 @@ def coverageview_meta_info(builder: TreeBuilder, metadata: List[dict], name: str
                     # k_1: entry -> coverageView -> coverageBands
                     # v_1: entry -> coverageView -> coverageBands -[coverageband_1,coverageband_2]
                     if k_1.lower() == 'coverageview':
-                        builder.start('coverageView')
+                        builder.start('coverageView', dict())
                         for k_bands, v_bands in v_1.items():
                             if k_bands.lower() == 'coveragebands':
-                                builder.start('coverageBands')
+                                builder.start('coverageBands', dict())
                                 for k_band, v_band in v_bands.items():
                                     # k_band:'coverageband_1'
                                     # v_band: entry -> coverageView -> coverageBands- > {}
                                     coverageBand_info(builder, v_band)
                                 builder.end('coverageBands')
-                            elif k_bands.lower() in [temp.lower() for temp in
-                                                     ['name', 'envelopeCompositionType', 'selectedResolution',
-                                                      'selectedResolutionIndex']]:
-                                builder.start(k_bands)
+                            elif k_bands.lower() in _COVERAGEVIEW_TEXT_KEYS:
+                                builder.start(k_bands, dict())
                                 builder.data(v_bands)
                                 builder.end(k_bands)
                             pass
@@ -553,7 +733,7 @@ def coverageview_store_info(builder: TreeBuilder, data: dict, name='store'):
     # if 'classname' in data.items():
     if data.get('classname'):
         builder.start(name, {'class': data.get('classname')})
-        builder.start('name')
+        builder.start('name', dict())
         builder.data(data.get('name', None))
         builder.end('name')
         builder.end(name)
@@ -565,7 +745,7 @@ def coverageBand_info(builder: TreeBuilder, data: dict):
         多路 band
     '''
     if isinstance(data, dict):
-        builder.start('coverageBand')
+        builder.start('coverageBand', dict())
         for k, v in data.items():
             # inputCoverageBands
             # definition
@@ -628,11 +808,11 @@ def covreageview_dimensions_info(builder: TreeBuilder, data: dict, name: str = N
     # 将 dict -> dimensions 数组
     if isinstance(data, dict):
         if name is not None:
-            builder.start(name)
+            builder.start(name, dict())
         for k, v in data.items():
             if 'coveragedimension' in k.lower():
                 # 是一个数组
-                builder.start('coverageDimension')
+                builder.start('coverageDimension', dict())
                 if isinstance(v, CoverageDimensionMidModel):
                     coverageDimension_info(builder, v)
                 builder.end('coverageDimension')
@@ -653,27 +833,188 @@ def coverageDimension_info(builder: TreeBuilder, data: CoverageDimensionMidModel
         builder.data(data.name)
         builder.end('name')
         # desc
-        builder.start('description')
+        builder.start('description', dict())
         builder.data(data.des)
         builder.end('description')
         # type
-        builder.start('dimensionType')
-        builder.start('name')
+        builder.start('dimensionType', dict())
+        builder.start('name', dict())
         builder.data(data.type)
         builder.end('name')
         builder.end('dimensionType')
         #
-        builder.start('range')
-        builder.start('min')
-        builder.data(data.range[0])
+        # range 的值可以是数值
+        builder.start('range', dict())
+        builder.start('min', dict())
+        builder.data(str(data.range[0]))
         builder.end('min')
-        builder.start('max')
-        builder.data(data.range[1])
+        builder.start('max', dict())
+        builder.data(str(data.range[1]))
         builder.end('max')
         builder.end('range')
     pass
 
 
+def _text_node(value):
+    """value escaped like ElementTree escapes text nodes. Raises ValueError for
+    values ElementTree serializes otherwise: empty text is written as <tag />,
+    non strings fail to serialize"""
+    if not isinstance(value, str) or not value:
+        raise ValueError("Not a text node: %r" % (value,))
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class CoverageViewTemplate(object):
+    """coverageview_xml compiled for coverage dicts shaped like the prototype
+    (eg: customer_layer.CoverageLayer.build_coverage). The prototype is serialized
+    once with placeholders in place of the per-layer values (names, namespace,
+    title, store, bands and dimensions); render() only splices those values
+    into the resulting skeleton. The prototype needs at least one band and one
+    dimension.
+
+    render(info) returns exactly the bytes of
+    tostring(coverageview_xml(info).close(), encoding='utf-8', method='xml'):
+    it falls back to coverageview_xml when info differs from the prototype in
+    layout or in a value that is not spliced in, or when a spliced value is
+    empty or not a string."""
+
+    # placeholder numbers: layer values from 0, band values from 20, dimension values from 30
+    _BAND, _DIMENSION = 20, 30
+
+    # the keys, in order, of the coverage dict, its namespace, metadata COVERAGE_VIEW entry,
+    # coverageview and store (see _slots)
+    _LAYOUT = (
+        ('name', 'nativeName', 'namespace', 'title', 'description', 'nativeCoverageName', 'enabled', 'nativeFormat',
+         'requestSRS', 'responseSRS', 'defaultInterpolationMethod', 'metadata', 'store', 'dimensions'),
+        ('name', 'atom'),
+        ('coverageview',),
+        ('name', 'envelopeCompositionType', 'selectedResolution', 'selectedResolutionIndex', 'coverageBands'),
+        ('classname', 'name'),
+    )
+    # the keys of a coverage band, its inputCoverageBands and inputCoverageBand
+    _BAND_LAYOUT = (('definition', 'index', 'inputCoverageBands'), ('inputCoverageBand',), ('coverageName',))
+
+    def __init__(self, prototype: dict):
+        statics, _, bands, dimensions = self._slots(prototype)
+        if not bands or not dimensions:
+            raise ValueError("The prototype needs at least one band and one dimension")
+        self._statics = statics
+
+        skeleton = self._render_xml(self._tokenized(prototype)).decode('utf-8')
+        skeleton, band = self._cut(skeleton, 'coverageBands', '@@B@@')
+        skeleton, dimension = self._cut(skeleton, 'dimensions', '@@D@@')
+        self._format = self._compile(skeleton, 0)
+        self._band_format = self._compile(band, self._BAND)
+        self._dimension_format = self._compile(dimension, self._DIMENSION)
+
+    @staticmethod
+    def _render_xml(info):
+        return tostring(coverageview_xml(info).close(), encoding='utf-8', method='xml')
+
+    @staticmethod
+    def _slots(info):
+        """Returns (static values, layer values, band values, dimension values) of a
+        coverage dict shaped like CoverageLayer.build_coverage, raises for any other
+        layout. The values are listed in the order of the placeholders (_tokenized)."""
+        namespace = info['namespace']
+        caching, dir_name, view_entry = info['metadata']
+        view = view_entry['val']['coverageview']
+        store = info['store']
+        layout = tuple(tuple(d) for d in (info, namespace, view_entry['val'], view, store))
+        if layout != CoverageViewTemplate._LAYOUT:
+            raise ValueError("Unexpected coverage layout")
+
+        bands = []
+        for band in view['coverageBands'].values():
+            input_bands = band['inputCoverageBands']
+            layout = tuple(tuple(d) for d in (band, input_bands, input_bands['inputCoverageBand']))
+            if layout != CoverageViewTemplate._BAND_LAYOUT:
+                raise ValueError("Unexpected coverage band layout")
+            bands.append((str(band['definition']), str(band['index']),
+                          input_bands['inputCoverageBand']['coverageName']))
+
+        dimensions = []
+        for k, dimension in info['dimensions'].items():
+            if 'coveragedimension' not in k.lower() or not isinstance(dimension, CoverageDimensionMidModel):
+                raise ValueError("Unexpected coverage dimension")
+            dimensions.append((dimension.name, dimension.des, dimension.type, dimension.range[0], dimension.range[1]))
+
+        statics = (
+            info['enabled'], info['nativeFormat'], tuple(info['requestSRS'].items()),
+            tuple(info['responseSRS'].items()), info['defaultInterpolationMethod'],
+            tuple((e['key'], e['name']) for e in info['metadata']), caching['val'],
+            view['envelopeCompositionType'], view['selectedResolution'], view['selectedResolutionIndex'],
+            store['classname']
+        )
+        values = (info['name'], info['nativeName'], namespace['name'], namespace['atom'], info['title'],
+                  info['nativeCoverageName'], dir_name['val'], view['name'], store['name'])
+        return statics, values, bands, dimensions
+
+    @classmethod
+    def _tokenized(cls, prototype):
+        """a copy of prototype with placeholders in place of the values _slots returns,
+        and a single band and dimension"""
+        def token(i):
+            return '@@%d@@' % i
+
+        caching, dir_name, view_entry = prototype['metadata']
+        view = dict(view_entry['val']['coverageview'], name=token(7))
+        view['coverageBands'] = dict(coverageband_0=dict(
+            definition=token(cls._BAND),
+            index=token(cls._BAND + 1),
+            inputCoverageBands=dict(inputCoverageBand=dict(coverageName=token(cls._BAND + 2)))
+        ))
+        info = dict(prototype)
+        info.update(
+            name=token(0),
+            nativeName=token(1),
+            namespace=dict(name=token(2), atom=token(3)),
+            title=token(4),
+            nativeCoverageName=token(5),
+            metadata=[caching, dict(dir_name, val=token(6)), dict(view_entry, val=dict(coverageview=view))],
+            store=dict(prototype['store'], name=token(8)),
+            dimensions=dict(coverageDimension_0=CoverageDimensionMidModel(
+                token(cls._DIMENSION), token(cls._DIMENSION + 1),
+                [token(cls._DIMENSION + 3), token(cls._DIMENSION + 4)], token(cls._DIMENSION + 2)))
+        )
+        return info
+
+    @staticmethod
+    def _cut(skeleton, tag, placeholder):
+        """replaces the (single) tag element by placeholder, returns its children"""
+        start = skeleton.index('<%s>' % tag)
+        end = skeleton.index('</%s>' % tag)
+        return skeleton[:start] + placeholder + skeleton[end + len(tag) + 3:], skeleton[start + len(tag) + 2:end]
+
+    @staticmethod
+    def _compile(fragment, first):
+        """turns the placeholders of fragment into str.format fields: {index of the value}
+        (placeholder number - first), {B} for the bands and {D} for the dimensions"""
+        parts = fragment.split('@@')
+        return ''.join(part.replace('{', '{{').replace('}', '}}') if i % 2 == 0 else
+                       '{%s}' % (int(part) - first if part.isdigit() else part)
+                       for i, part in enumerate(parts))
+
+    def render(self, info: dict) -> bytes:
+        try:
+            statics, values, bands, dimensions = self._slots(info)
+            if statics != self._statics:
+                raise ValueError("Static values differ from the prototype")
+            values = [_text_node(v) for v in values]
+            bands = ''.join(self._band_format.format(*[_text_node(v) for v in band]) for band in bands)
+            dimensions = ''.join(self._dimension_format.format(*[_text_node(v) for v in dimension])
+                                 for dimension in dimensions)
+            # ElementTree writes an element without children as <tag />
+            return self._format.format(
+                *values,
+                B='<coverageBands>%s</coverageBands>' % bands if bands else '<coverageBands />',
+                D='<dimensions>%s</dimensions>' % dimensions if dimensions else '<dimensions />'
+            ).encode('utf-8')
+        except (KeyError, TypeError, ValueError, AttributeError, IndexError, UnicodeEncodeError):
+            # UnicodeEncodeError: eg: lone surrogates, which ElementTree writes as character references
+            return self._render_xml(info)
+
+
 def dimension_info(builder, metadata):
     if isinstance(metadata, DimensionInfo):
         builder.start("dimensionInfo", dict())
@@ -0,0 +1,194 @@
+import asyncio
+import base64
+import unittest
+from unittest import mock
+
+from geoserver.async_catalog import AsyncCatalog
+from geoserver.catalog import FailedRequestError
+from .catalogtests import MOCK_URL, MockTransport, listing
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+except ImportError:
+    web = None
+
+
+class MockClientResponse(object):
+
+    def __init__(self, response, gate=None):
+        self.status = response.status_code
+        self.headers = response.headers
+        self._content = response.content
+        self._gate = gate
+
+    async def read(self):
+        return self._content
+
+    async def __aenter__(self):
+        if self._gate is not None:
+            await self._gate.wait()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class MockSession(object):
+    '''
+        Stands in for the aiohttp.ClientSession of an AsyncCatalog, answering
+        from a MockTransport. Requests are recorded as (method, url) when they
+        are sent; with a gate (asyncio.Event) set, responses wait for it.
+    '''
+
+    def __init__(self, routes=None):
+        self.transport = MockTransport(routes)
+        self.closed = False
+        self.gate = None
+
+    def request(self, method, url, data=None, headers=None):
+        return MockClientResponse(self.transport(url, data, method, headers), self.gate)
+
+    async def close(self):
+        self.closed = True
+
+
+def mock_async_catalog(routes=None, **kwargs):
+    '''an AsyncCatalog on MOCK_URL whose requests go to a MockSession (acat._session)'''
+    with mock.patch('geoserver.async_catalog.aiohttp'):
+        acat = AsyncCatalog(MOCK_URL, **kwargs)
+    acat._session = MockSession(routes)
+    return acat
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class AsyncCatalogTests(unittest.TestCase):
+
+    def testGetStores(self):
+        ws = MOCK_URL + '/workspaces/ws'
+        acat = mock_async_catalog({
+            ('get', MOCK_URL + '/workspaces.xml'): (200, listing('workspace', ['ws'])),
+            ('get', ws + '/datastores.xml'): (200, listing('dataStore', ['roads'])),
+            ('get', ws + '/coveragestores.xml'): (200, listing('coverageStore', ['nc'])),
+            ('get', ws + '/wmsstores.xml'): (200, listing('wmsStore', [])),
+        })
+
+        async def get_stores_twice():
+            async with acat:
+                return await asyncio.gather(acat.get_stores(), acat.get_stores())
+
+        session = acat._session
+        stores, again = run(get_stores_twice())
+        self.assertEqual(['roads', 'nc'], [s.name for s in stores])
+        self.assertEqual(['roads', 'nc'], [s.name for s in again])
+        # the concurrent identical GETs were coalesced
+        self.assertEqual(1, session.transport.count('get', MOCK_URL + '/workspaces.xml'))
+        self.assertEqual(1, session.transport.count('get', ws + '/coveragestores.xml'))
+        self.assertTrue(session.closed)
+
+    def testGetResourceDirectly(self):
+        url = MOCK_URL + '/workspaces/ws/coverages/wind.xml'
+        coverage = b'<coverage><name>wind</name><store class="coverageStore"><name>ws:nc</name></store></coverage>'
+        acat = mock_async_catalog({
+            ('get', url): (200, coverage),
+            ('get', MOCK_URL + '/workspaces/ws/featuretypes/locked.xml'): (401, b'Unauthorized'),
+            ('put', MOCK_URL + '/workspaces/ws/coveragestores/nc/coverages/wind.xml'): (200, b''),
+        })
+        transport = acat._session.transport
+
+        async def lookup_save_lookup():
+            resource, = await acat.get_resources('wind', workspaces='ws')
+            # returned fetched, reading it does not go through the blocking catalog
+            self.assertEqual('nc', resource.store.name)
+            self.assertIsNotNone(resource.dom)
+            self.assertEqual(1, transport.count('get', url))
+
+            with self.assertRaises(FailedRequestError) as failure:
+                await acat.get_resources('locked', workspaces='ws')
+            self.assertEqual(401, failure.exception.status_code)
+
+            await acat.save(resource)
+            await acat.get_resources('wind', workspaces='ws')
+
+        run(lookup_save_lookup())
+        # the save evicted the workspace level lookup
+        self.assertEqual(2, transport.count('get', url))
+
+    def testInflightBeforeInvalidation(self):
+        url = MOCK_URL + '/workspaces.xml'
+        acat = mock_async_catalog()
+        versions = iter([listing('workspace', ['old']), listing('workspace', ['new'])])
+        acat._session.transport.routes[('get', url)] = lambda url, data, headers: (200, next(versions))
+
+        async def read_across_invalidation():
+            acat._session.gate = asyncio.Event()
+            started = asyncio.ensure_future(acat.get_workspaces())
+            while not acat._session.transport.requests:
+                await asyncio.sleep(0)
+            # a write lands while the first GET is in flight
+            acat.catalog.invalidate_cache()
+            fresh = asyncio.ensure_future(acat.get_workspaces())
+            while len(acat._session.transport.requests) < 2:
+                await asyncio.sleep(0)
+            acat._session.gate.set()
+            return await started, await fresh
+
+        stale, fresh = run(read_across_invalidation())
+        self.assertEqual(['old'], [ws.name for ws in stale])
+        self.assertEqual(['new'], [ws.name for ws in fresh])
+        self.assertEqual(['new'], [ws.name for ws in run(acat.get_workspaces())])
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class AsyncCatalogServerTests(unittest.TestCase):
+    '''AsyncCatalog on a real aiohttp session, against a local aiohttp server'''
+
+    def testGetWorkspaces(self):
+        requests = []
+
+        async def geoserver(request):
+            requests.append((request.method, request.path, request.headers.get('If-None-Match')))
+            if request.headers.get('Authorization') != 'Basic ' + base64.b64encode(b'admin:secret').decode():
+                return web.Response(status=401)
+            if request.path != '/geoserver/rest/workspaces.xml':
+                return web.Response(status=404, text='No such workspace')
+            if request.headers.get('If-None-Match') == '"1"':
+                return web.Response(status=304)
+            return web.Response(body=listing('workspace', ['ws']), content_type='application/xml',
+                                headers={'ETag': '"1"'})
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_route('*', '/{path:.*}', geoserver)
+            server = TestServer(app)
+            await server.start_server()
+            try:
+                service_url = str(server.make_url('/geoserver/rest'))
+                async with AsyncCatalog(service_url, 'admin', 'secret', cache_ttl=0) as acat:
+                    workspaces = await acat.get_workspaces()
+                    # expired at once: revalidated with the ETag, the server answers 304
+                    again = await acat.get_workspaces()
+                    missing = await acat.get_resources('wind', workspaces='ws')
+                async with AsyncCatalog(service_url, 'admin', 'wrong') as acat:
+                    with self.assertRaises(FailedRequestError) as failure:
+                        await acat.get_workspaces()
+                return workspaces, again, missing, failure.exception.status_code
+            finally:
+                await server.close()
+
+        workspaces, again, missing, status_code = run(scenario())
+        self.assertEqual(['ws'], [ws.name for ws in workspaces])
+        self.assertEqual(['ws'], [ws.name for ws in again])
+        self.assertEqual([], missing)
+        self.assertEqual(401, status_code)
+        self.assertEqual([('GET', '/geoserver/rest/workspaces.xml', None),
+                          ('GET', '/geoserver/rest/workspaces.xml', '"1"')], requests[:2])
+        # then one 404 per resource type for wind, and the rejected GET
+        self.assertEqual(2 + 3 + 1, len(requests))
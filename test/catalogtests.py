@@ -1,20 +1,35 @@
+import io
+import json
 import os
 import subprocess
 import atexit
 import signal
+import sys
+import tempfile
 import time
+import threading
 import re
 import unittest
+import zipfile
+from unittest import mock
 import gisdata
+import geoserver
+from xml.etree.ElementTree import XML, SubElement, tostring
 from geoserver.catalog import Catalog
 from geoserver.catalog import ConflictingDataError
 from geoserver.catalog import UploadError
 from geoserver.catalog import FailedRequestError
-from geoserver.support import ResourceInfo, build_url
+from geoserver.catalog import parse_version
+from geoserver.cache import ResponseCache, CachedDocument
+from geoserver.support import ResourceInfo, build_url, UploadStream, UploadBundle
+from geoserver.support import CoverageViewTemplate, CoverageDimensionMidModel, coverageview_xml
 from geoserver.support import DimensionInfo
 from geoserver.support import JDBCVirtualTable
 from geoserver.support import JDBCVirtualTableGeometry
+from geoserver.layer import Layer
 from geoserver.layergroup import LayerGroup
+from geoserver.workspace import Workspace
+from geoserver.netcdf import read_header
 from geoserver.util import shapefile_and_friends
 from .utils import DBPARAMS
 from .utils import GSPARAMS
@@ -127,6 +142,89 @@ def drop_table(table):
     return outer
 
 
+MOCK_URL = "http://localhost:8080/geoserver/rest"
+
+
+class MockResponse(object):
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class MockTransport(object):
+    '''
+        Stands in for Catalog.http_request: answers from routes, a dict of
+        (method, url) -> (status_code, content[, headers]) or a callable(url, data, headers)
+        returning one, 404 for anything else. A url without a query string also answers
+        the requests with one. Records every request as (method, url).
+    '''
+
+    def __init__(self, routes=None):
+        self.routes = dict(routes or {})
+        self.requests = []
+
+    def __call__(self, url, data=None, method='get', headers={}):
+        self.requests.append((method.lower(), url))
+        route = self.routes.get((method.lower(), url)) or self.routes.get((method.lower(), url.split('?')[0]))
+        if route is None:
+            route = (404, b'Not found')
+        if callable(route):
+            route = route(url, data, headers)
+        return MockResponse(*route)
+
+    def count(self, method, url):
+        return self.requests.count((method, url))
+
+
+def listing(tag, names):
+    '''a REST listing of tag elements with the given names'''
+    items = ''.join('<{0}><name>{1}</name></{0}>'.format(tag, name) for name in names)
+    return '<{0}s>{1}</{0}s>'.format(tag, items).encode('utf-8')
+
+
+def about_version(version):
+    '''the /about/version.xml of a GeoServer version'''
+    return '<about><resource name="GeoServer"><Version>{}</Version></resource></about>'.format(version).encode('utf-8')
+
+
+def layer_document(name, ws_name, store_name):
+    '''the /layers/{ws}:{name}.xml of a coverage layer'''
+    href = '{}/workspaces/{}/coveragestores/{}/coverages/{}.xml'.format(MOCK_URL, ws_name, store_name, name)
+    return ('<layer><name>{0}</name><resource class="coverage"><name>{1}:{0}</name>'
+            '<atom:link xmlns:atom="http://www.w3.org/2005/Atom" rel="alternate" href="{2}"/></resource>'
+            '</layer>').format(name, ws_name, href).encode('utf-8')
+
+
+def mock_catalog(routes=None, **kwargs):
+    '''a Catalog on MOCK_URL whose requests go to a MockTransport (cat.http_request)'''
+    cat = Catalog(MOCK_URL, **kwargs)
+    cat.http_request = MockTransport(routes)
+    return cat
+
+
+def customer_layer():
+    '''the customer_layer module, which imports its siblings as top level modules'''
+    with mock.patch.object(sys, 'path', [os.path.dirname(geoserver.__file__)] + sys.path):
+        import customer_layer
+    return customer_layer
+
+
+def customer_style():
+    '''the customer_style module (see customer_layer)'''
+    with mock.patch.object(sys, 'path', [os.path.dirname(geoserver.__file__)] + sys.path):
+        import customer_style
+    return customer_style
+
+
 class NonCatalogTests(unittest.TestCase):
 
     def testDimensionInfo(self):
@@ -145,6 +243,699 @@ class NonCatalogTests(unittest.TestCase):
         assertEqualResolution('7 days', 604800000)
         assertEqualResolution('10 years', 315360000000000)
 
+    def testResponseCache(self):
+        cache = ResponseCache(max_entries=2, max_bytes=10, ttl=60)
+        cache.set('a', b'1234')
+        cache.set('b', b'1234')
+        self.assertEqual(b'1234', cache.get('a'))
+        # 'b' is now the least recently used entry
+        cache.set('c', b'1234')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(b'1234', cache.get('c'))
+        # byte bound
+        cache.set('d', b'12345678')
+        self.assertEqual(['d'], [k for k in ('a', 'c', 'd') if k in cache])
+        stats = cache.stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(3, stats['evictions'])
+        self.assertEqual(8, stats['bytes'])
+        # evictions leave the generation alone, invalidations bump it
+        self.assertEqual(0, stats['generation'])
+        cache.pop_prefix('x')
+        self.assertEqual(0, cache.generation)
+        cache.pop_prefix('d')
+        self.assertEqual(1, cache.generation)
+
+        expired = ResponseCache(ttl=0)
+        expired.set('a', b'1')
+        self.assertIsNone(expired.get('a'))
+
+    def testCacheParsed(self):
+        url = MOCK_URL + "/layers/ws:wind.xml"
+        cat = mock_catalog({('get', url): (200, b'<layer><name>wind</name><enabled>true</enabled></layer>')},
+                           cache_parsed=True)
+        with mock.patch('geoserver.catalog.XML', wraps=XML) as parse:
+            dom = cat.get_xml(url)
+            # modifying the returned tree (eg: before a save) does not touch the cached one
+            dom.find('enabled').text = 'false'
+            SubElement(dom, 'title').text = 'Wind'
+            again = cat.get_xml(url)
+            self.assertEqual(1, parse.call_count)
+        self.assertEqual(1, cat.http_request.count('get', url))
+        self.assertEqual('true', again.findtext('enabled'))
+        self.assertIsNone(again.find('title'))
+        self.assertIsNot(dom, again)
+
+    def testConnectionPool(self):
+        cat = mock_catalog(pool_connections=2, pool_maxsize=4, pool_block=True, keep_alive=False)
+        adapter = cat.client.get_adapter(MOCK_URL)
+        self.assertEqual((2, 4, True), (adapter._pool_connections, adapter._pool_maxsize, adapter._pool_block))
+        self.assertEqual('close', cat.client.headers['Connection'])
+        self.assertEqual('keep-alive', mock_catalog().client.headers['Connection'])
+
+        stats = cat.get_pool_stats()
+        self.assertEqual(dict(pool_connections=2, pool_maxsize=4, pool_block=True, keep_alive=False, pools=[]),
+                         stats)
+        # a pool is created on the first request, its connections are opened on checkout
+        pool = adapter.poolmanager.connection_from_url(MOCK_URL)
+        conn = pool._get_conn()
+        self.assertEqual([dict(host='localhost', port=8080, maxsize=4, in_use=1, idle=0, connections=1, requests=0)],
+                         cat.get_pool_stats()['pools'])
+        pool._put_conn(conn)
+        self.assertEqual(dict(in_use=0, idle=1), {k: cat.get_pool_stats()['pools'][0][k] for k in ('in_use', 'idle')})
+
+    def testConditionalGet(self):
+        url = MOCK_URL + "/workspaces.xml"
+        versions = [b'<workspaces><workspace><name>a</name></workspace></workspaces>']
+        validators = []
+
+        def answer(url, data, headers):
+            etag = '"%d"' % len(versions)
+            validators.append(headers.get('If-None-Match'))
+            if headers.get('If-None-Match') == etag:
+                return (304, b'')
+            return (200, versions[-1], {'ETag': etag})
+
+        cat = mock_catalog({('get', url): answer}, cache_ttl=0)
+        self.assertEqual('a', cat.get_xml(url).findtext('workspace/name'))
+        # expired: revalidated, the server answers 304 and the cached document is reused
+        self.assertEqual('a', cat.get_xml(url).findtext('workspace/name'))
+        self.assertEqual(1, cat.get_cache_stats()['revalidations'])
+        versions.append(b'<workspaces><workspace><name>b</name></workspace></workspaces>')
+        self.assertEqual('b', cat.get_xml(url).findtext('workspace/name'))
+        self.assertEqual([None, '"1"', '"1"'], validators)
+
+    def testStaleWhileRevalidate(self):
+        url = MOCK_URL + "/workspaces.xml"
+        versions = [b'<workspaces><workspace><name>a</name></workspace></workspaces>']
+        cat = mock_catalog({('get', url): lambda url, data, headers: (200, versions[-1])},
+                           cache_ttl=0, stale_while_revalidate=60)
+        self.assertEqual('a', cat.get_xml(url).findtext('workspace/name'))
+        versions.append(b'<workspaces><workspace><name>b</name></workspace></workspaces>')
+        # expired but within the window: served as is, refreshed in the background
+        self.assertEqual('a', cat.get_xml(url).findtext('workspace/name'))
+        # the refresh worker is a single thread, this runs once the refresh is done
+        cat._refresher.submit(lambda: None).result()
+        self.assertEqual(2, cat.http_request.count('get', url))
+        self.assertEqual('b', cat.get_xml(url).findtext('workspace/name'))
+
+    def testCoalescedGet(self):
+        url = MOCK_URL + "/layers.xml"
+        readers = 8
+        release = threading.Event()
+
+        def answer(url, data, headers):
+            release.wait(5)
+            return (200, listing('layer', ['ws:wind', 'ws:rain']))
+
+        cat = mock_catalog({('get', url): answer})
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cat.get_xml(url))) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        # hold the first GET until every other reader waits on it
+        deadline = time.time() + 5
+        while cat.get_cache_stats()['coalesced'] < readers - 1 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, cat.http_request.count('get', url))
+        self.assertEqual(readers - 1, cat.get_cache_stats()['coalesced'])
+        self.assertEqual(readers, len(results))
+        self.assertEqual({listing('layer', ['ws:wind', 'ws:rain'])}, set(tostring(dom) for dom in results))
+
+    def testReadAfterWrite(self):
+        url = MOCK_URL + "/workspaces/ws/datastores/ds.xml"
+        versions = [b'<dataStore><name>old</name></dataStore>']
+        in_flight, release = threading.Event(), threading.Event()
+
+        def answer(url, data, headers):
+            body = versions[-1]
+            if threading.current_thread().name == 'reader':
+                in_flight.set()
+                release.wait(5)
+            return (200, body)
+
+        cat = mock_catalog({('get', url): answer}, cache_ttl=60)
+        reader = threading.Thread(target=cat.get_xml, args=(url,), name='reader')
+        reader.start()
+        in_flight.wait(5)
+        # written while the reader's GET is in flight: the next read must not share it
+        versions.append(b'<dataStore><name>new</name></dataStore>')
+        cat.invalidate_cache(url, 'dataStore')
+        self.assertEqual('new', cat.get_xml(url).findtext('name'))
+        release.set()
+        reader.join(5)
+        # nor may the reader's outdated response replace the cached one
+        self.assertEqual('new', cat.get_xml(url).findtext('name'))
+        self.assertEqual(2, cat.http_request.count('get', url))
+
+    def testGetStoresConcurrently(self):
+        # both workspaces' datastore listings have to be in flight at the same time
+        barrier = threading.Barrier(2, timeout=5)
+
+        def datastores(names):
+            def answer(url, data, headers):
+                barrier.wait()
+                return (200, listing('dataStore', names))
+            return answer
+
+        routes = {('get', MOCK_URL + '/workspaces.xml'): (200, listing('workspace', ['ws1', 'ws2']))}
+        for ws in ('ws1', 'ws2'):
+            base = MOCK_URL + '/workspaces/' + ws
+            routes[('get', base + '/datastores.xml')] = datastores([ws + '_ds'])
+            routes[('get', base + '/coveragestores.xml')] = (200, listing('coverageStore', [ws + '_cs1', ws + '_cs2']))
+            routes[('get', base + '/wmsstores.xml')] = (200, listing('wmsStore', []))
+        cat = mock_catalog(routes, concurrency=4)
+
+        names = [s.name for s in cat.get_stores()]
+        self.assertEqual(['ws1_ds', 'ws1_cs1', 'ws1_cs2', 'ws2_ds', 'ws2_cs1', 'ws2_cs2'], names)
+        # same order sequentially (served from the cache)
+        self.assertEqual(names, [s.name for s in cat.get_stores(concurrency=1)])
+        self.assertEqual(7, len(cat.http_request.requests))
+        self.assertEqual(['ws2_cs1'], [s.name for s in cat.get_stores(names='ws2_cs1', workspaces='ws2')])
+
+    def testGetStoreDirectly(self):
+        ws = MOCK_URL + "/workspaces/ws"
+        cat = mock_catalog({
+            ('get', ws + '/coveragestores/nc.xml'): (200, b'<coverageStore><name>nc</name></coverageStore>'),
+            ('get', ws + '/datastores/locked.xml'): (401, b'Unauthorized'),
+        })
+        store = cat.get_store('nc', 'ws')
+        self.assertEqual(('nc', 'coverageStore'), (store.name, store.resource_type))
+        # probed the three store types directly, no listing
+        self.assertEqual(sorted(['datastores', 'coveragestores', 'wmsstores']),
+                         sorted(url.split('/')[-2] for _, url in cat.http_request.requests))
+        self.assertIsNone(cat.get_store('missing', 'ws', store_types=['wmsstores']))
+        # only a 404 is a miss
+        with self.assertRaises(FailedRequestError) as raised:
+            cat.get_store('locked', 'ws', store_types=['datastores', 'coveragestores'])
+        self.assertEqual(401, raised.exception.status_code)
+
+        # several workspaces are looked up in the listings, as get_stores does
+        cat.http_request.routes[('get', MOCK_URL + '/workspaces.xml')] = (200, listing('workspace', ['ws1', 'ws2']))
+        for ws_name, coverage_stores in (('ws1', []), ('ws2', ['nc2'])):
+            base = MOCK_URL + '/workspaces/' + ws_name
+            cat.http_request.routes.update({
+                ('get', base + '/datastores.xml'): (200, listing('dataStore', [])),
+                ('get', base + '/coveragestores.xml'): (200, listing('coverageStore', coverage_stores)),
+                ('get', base + '/wmsstores.xml'): (200, listing('wmsStore', [])),
+            })
+        for workspaces in (['ws1', 'ws2'], 'ws1, ws2', [Workspace(cat, 'ws1'), Workspace(cat, 'ws2')]):
+            store = cat.get_store('nc2', workspaces)
+            self.assertEqual(('ws2', 'nc2'), (store.workspace.name, store.name))
+        self.assertIsNone(cat.get_store('nc2', ['ws1', 'ws2'], store_types=['datastores']))
+        self.assertIsNone(cat.get_store('nc2', 'ws1,ws2', store_types=['wmsstores']))
+
+    def testGetResourceDirectly(self):
+        ws = MOCK_URL + "/workspaces/ws"
+        coverage = (200, b'<coverage><name>wind</name><store class="coverageStore"><name>ws:nc</name></store></coverage>')
+        cat = mock_catalog({
+            ('get', ws + '/coverages/wind.xml'): coverage,
+            ('get', ws + '/featuretypes/broken.xml'): (500, b'Internal error'),
+        })
+        resource = cat.get_resource('wind', workspace='ws')
+        self.assertEqual(('wind', 'nc', 'coverage'), (resource.name, resource.store.name, resource.resource_type))
+        self.assertEqual(3, len(cat.http_request.requests))
+        self.assertEqual([], cat.get_resources(names='wind', stores='other', workspaces='ws'))
+        # writing the coverage evicts the workspace level lookup
+        cat.invalidate_cache(ws + '/coveragestores/nc/coverages/wind.xml', 'coverage')
+        cat.get_resource('wind', workspace='ws')
+        self.assertEqual(2, cat.http_request.count('get', ws + '/coverages/wind.xml'))
+        # only a 404 is a miss
+        with self.assertRaises(FailedRequestError) as raised:
+            cat.get_resource('broken', workspace='ws')
+        self.assertEqual(500, raised.exception.status_code)
+
+    def testGetLayersPrefetch(self):
+        names = ['ws:l%d' % i for i in range(10)]
+        routes = {('get', MOCK_URL + '/layers.xml'): (200, listing('layer', names))}
+        for name in names:
+            routes[('get', '{}/layers/{}.xml'.format(MOCK_URL, name))] = (200, b'<layer><name>%s</name></layer>' % name[3:].encode())
+        routes[('get', MOCK_URL + '/layers/ws:l1.xml')] = (500, b'Internal error')
+        cat = mock_catalog(routes, cache_max_entries=4, concurrency=4)
+
+        # every layer is fetched, however small the cache
+        lyrs = cat.get_layers(prefetch=True)
+        self.assertEqual(names, [lyr.name for lyr in lyrs])
+        self.assertEqual([True, False] + [True] * 8, [lyr.dom is not None for lyr in lyrs])
+        self.assertEqual(11, len(cat.http_request.requests))
+        self.assertEqual('l9', lyrs[9].dom.findtext('name'))
+        # the documents stay on the layers, the cache still holds the listing only
+        self.assertIn(MOCK_URL + '/layers.xml', cat._cache)
+        self.assertEqual(1, cat.get_cache_stats()['entries'])
+        # a failing layer does not fail the listing, it is fetched again on access
+        self.assertRaises(FailedRequestError, lambda: lyrs[1].resource)
+
+    def testLayerResource(self):
+        ws = MOCK_URL + '/workspaces/ws'
+        cat = mock_catalog({
+            ('get', MOCK_URL + '/about/version.xml'): (200, about_version('2.15.1')),
+            ('get', MOCK_URL + '/layers/ws:wind.xml'): (200, layer_document('wind', 'ws', 'nc')),
+        })
+        # a missing resource is None (it used to raise IndexError)
+        self.assertIsNone(Layer(cat, 'ws:wind').resource)
+
+        cat.http_request.routes[('get', ws + '/coverages/wind.xml')] = (
+            200, b'<coverage><name>wind</name><store class="coverageStore"><name>ws:nc</name></store></coverage>')
+        cat.invalidate_cache()
+        resource = Layer(cat, 'ws:wind').resource
+        self.assertEqual(('ws', 'nc', 'wind'), (resource.workspace.name, resource.store.name, resource.name))
+        self.assertEqual(ws + '/coveragestores/nc/coverages/wind.xml', resource.href)
+
+    def testLayerVersionIsLazy(self):
+        version = MOCK_URL + '/about/version.xml'
+        routes = {('get', version): (200, about_version('2.15.1'))}
+        for i in range(10):
+            routes[('get', MOCK_URL + '/layers/ws:l%d.xml' % i)] = (200, layer_document('l%d' % i, 'ws', 'nc'))
+        cat = mock_catalog(routes)
+
+        layers = [Layer(cat, 'ws:l%d' % i) for i in range(10)]
+        self.assertEqual([], cat.http_request.requests)
+        for layer in layers:
+            layer.resource
+        # the version is requested once for every layer, when the first resource is resolved
+        self.assertEqual(1, cat.http_request.count('get', version))
+        self.assertEqual(('get', MOCK_URL + '/layers/ws:l0.xml'), cat.http_request.requests[0])
+        self.assertEqual('2.15.1', layers[-1].gs_version)
+        self.assertEqual(1, cat.http_request.count('get', version))
+
+    def testResolveStyles(self):
+        def styled_layer(name, style):
+            return '<layer><name>{}</name><defaultStyle><name>{}</name></defaultStyle></layer>'.format(
+                name, style).encode('utf-8')
+
+        routes = {
+            ('get', MOCK_URL + '/styles.xml'): (200, listing('style', ['point', 'line'])),
+            ('get', MOCK_URL + '/workspaces.xml'): (200, listing('workspace', ['ws'])),
+            ('get', MOCK_URL + '/workspaces/ws/styles.xml'): (200, listing('style', ['wind'])),
+            ('put', MOCK_URL + '/layers/ws:l0.xml'): (200, b''),
+        }
+        for i in range(20):
+            style = ('point', 'line', 'ws:wind')[i % 3]
+            routes[('get', MOCK_URL + '/layers/ws:l%d.xml' % i)] = (200, styled_layer('l%d' % i, style))
+        cat = mock_catalog(routes)
+
+        with mock.patch.object(cat, 'get_styles', wraps=cat.get_styles) as get_styles:
+            layers = [Layer(cat, 'ws:l%d' % i) for i in range(20)]
+            styles = [(lyr.default_style.workspace, lyr.default_style.name) for lyr in layers]
+            self.assertEqual([(None, 'point'), (None, 'line'), ('ws', 'wind')] * 6 + [(None, 'point'), (None, 'line')],
+                             styles)
+            # every layer resolved its style from one listing
+            self.assertEqual(1, get_styles.call_count)
+            self.assertEqual(1, cat.http_request.count('get', MOCK_URL + '/styles.xml'))
+            self.assertEqual(1, cat.http_request.count('get', MOCK_URL + '/workspaces/ws/styles.xml'))
+
+            # writing a layer keeps the index, writing a style rebuilds it
+            layers[0].enabled = False
+            cat.save(layers[0])
+            cat.resolve_style('point')
+            self.assertEqual(1, get_styles.call_count)
+            cat.invalidate_cache(MOCK_URL + '/workspaces/ws/styles/wind.xml')
+            self.assertEqual(('ws', 'wind'), (cat.resolve_style('wind').workspace, cat.resolve_style('wind').name))
+            self.assertEqual(2, get_styles.call_count)
+            self.assertEqual(2, cat.http_request.count('get', MOCK_URL + '/workspaces/ws/styles.xml'))
+
+    def testInvalidateCache(self):
+        cat = mock_catalog()
+        ws = MOCK_URL + "/workspaces/ws"
+        urls = [
+            MOCK_URL + "/layers.xml",
+            MOCK_URL + "/layers/ws:wind.xml",
+            MOCK_URL + "/layers/wind.xml",
+            MOCK_URL + "/layers/ws:other.xml",
+            MOCK_URL + "/styles.xml",
+            ws + ".xml",
+            ws + "/layers.xml",
+            ws + "/layers/wind.xml",
+            ws + "/layers/other.xml",
+            ws + "/coverages/wind.xml",
+            ws + "/featuretypes/roads.xml",
+            ws + "/coveragestores.xml",
+            ws + "/coveragestores/nc.xml",
+            ws + "/coveragestores/nc/coverages.xml",
+            ws + "/coveragestores/nc/coverages/wind.xml",
+            ws + "/coveragestores/other.xml",
+            ws + "/datastores/ds/featuretypes/roads.xml",
+            MOCK_URL + "/workspaces/ws2/coverages/wind.xml",
+        ]
+
+        def invalidate(href, resource_type):
+            cat.invalidate_cache()
+            for url in urls:
+                cat._cache.set(url, CachedDocument(b'<x/>'))
+            cat.invalidate_cache(href, resource_type)
+            return [url[len(MOCK_URL):] for url in urls if url not in cat._cache]
+
+        # a coverage save also evicts the layer listings and its workspace level lookup
+        self.assertEqual([
+            "/layers.xml", "/layers/ws:wind.xml", "/layers/wind.xml", "/layers/ws:other.xml",
+            "/workspaces/ws/layers.xml", "/workspaces/ws/layers/wind.xml", "/workspaces/ws/layers/other.xml",
+            "/workspaces/ws/coverages/wind.xml", "/workspaces/ws/coveragestores/nc/coverages.xml",
+            "/workspaces/ws/coveragestores/nc/coverages/wind.xml"
+        ], invalidate(ws + "/coveragestores/nc/coverages/wind.xml", "coverage"))
+        # so does publishing one (POST to the collection)
+        self.assertIn("/workspaces/ws/coverages/wind.xml",
+                      invalidate(ws + "/coveragestores/nc/coverages", "coverage"))
+        # a layer save evicts its aliases only
+        self.assertEqual([
+            "/layers.xml", "/layers/ws:wind.xml", "/layers/wind.xml",
+            "/workspaces/ws/layers.xml", "/workspaces/ws/layers/wind.xml"
+        ], invalidate(MOCK_URL + "/layers/ws:wind.xml", "layer"))
+        self.assertEqual(invalidate(MOCK_URL + "/layers/ws:wind.xml", "layer"),
+                         invalidate(ws + "/layers/wind.xml", "layer"))
+        # deleting a store (recurse) evicts what was below it and the workspace level copies
+        self.assertEqual([
+            "/layers.xml", "/layers/ws:wind.xml", "/layers/wind.xml", "/layers/ws:other.xml",
+            "/workspaces/ws/layers.xml", "/workspaces/ws/layers/wind.xml", "/workspaces/ws/layers/other.xml",
+            "/workspaces/ws/coverages/wind.xml", "/workspaces/ws/coveragestores.xml",
+            "/workspaces/ws/coveragestores/nc.xml", "/workspaces/ws/coveragestores/nc/coverages.xml",
+            "/workspaces/ws/coveragestores/nc/coverages/wind.xml"
+        ], invalidate(ws + "/coveragestores/nc.xml", "coverageStore"))
+        # a style does not touch the rest
+        self.assertEqual(["/styles.xml"], invalidate(MOCK_URL + "/styles/point.xml", "style"))
+        self.assertEqual(len(urls), len(invalidate(None, None)))
+
+    def testSaveMany(self):
+        ws = MOCK_URL + '/workspaces/ws'
+        saved = []
+        routes = {
+            ('get', MOCK_URL + '/workspaces.xml'): (200, listing('workspace', ['ws'])),
+            ('get', ws + '/datastores.xml'): (200, listing('dataStore', ['a', 'b', 'c'])),
+            ('get', ws + '/coveragestores.xml'): (200, listing('coverageStore', [])),
+            ('get', ws + '/wmsstores.xml'): (200, listing('wmsStore', [])),
+            ('put', ws + '/datastores/a.xml'): lambda url, data, headers: saved.append(data) or (200, b''),
+            ('put', ws + '/datastores/b.xml'): (500, b'Internal error'),
+            ('put', ws + '/datastores/c.xml'): (200, b''),
+        }
+        cat = mock_catalog(routes)
+        stores = cat.get_stores()
+        for store in stores:
+            store.enabled = False
+
+        class Unserializable(object):
+            href = ws + '/datastores/d.xml'
+            save_method = "PUT"
+
+            def message(self):
+                raise ValueError("no message")
+
+        results = cat.save_many(stores + [Unserializable()], concurrency=3)
+        self.assertEqual([True, False, True, False], [r.ok for r in results])
+        self.assertEqual(stores, [r.obj for r in results[:3]])
+        self.assertEqual(200, results[0].response.status_code)
+        self.assertIsInstance(results[1].error, FailedRequestError)
+        self.assertIsInstance(results[3].error, ValueError)
+        self.assertEqual([b'<dataStore><enabled>false</enabled><name>a</name></dataStore>'], saved)
+        self.assertEqual(0, cat.http_request.count('put', ws + '/datastores/d.xml'))
+
+        # the saved stores evicted the listing, it is requested again
+        cat.get_stores()
+        self.assertEqual(2, cat.http_request.count('get', ws + '/datastores.xml'))
+        self.assertEqual(1, cat.http_request.count('get', ws + '/coveragestores.xml'))
+
+    def testDeleteMany(self):
+        ws = MOCK_URL + '/workspaces/ws'
+        routes = {
+            ('get', MOCK_URL + '/workspaces.xml'): (200, listing('workspace', ['ws'])),
+            ('get', ws + '/datastores.xml'): (200, listing('dataStore', [])),
+            ('get', ws + '/coveragestores.xml'): (200, listing('coverageStore', ['nc'])),
+            ('get', ws + '/wmsstores.xml'): (200, listing('wmsStore', [])),
+            ('get', ws + '/coveragestores/nc/coverages.xml'): (200, listing('coverage', ['wind', 'rain'])),
+            ('get', MOCK_URL + '/layers.xml'): (200, listing('layer', ['ws:wind', 'ws:rain'])),
+            ('delete', MOCK_URL + '/layers/ws:wind.xml'): (200, b''),
+            ('delete', MOCK_URL + '/layers/ws:rain.xml'): (500, b'Internal error'),
+            ('delete', ws + '/coveragestores/nc/coverages/wind.xml'): (200, b''),
+            ('delete', ws + '/coveragestores/nc/coverages/rain.xml'): (200, b''),
+            ('delete', ws + '/coveragestores/nc.xml'): (200, b''),
+            ('delete', ws + '.xml'): (200, b''),
+        }
+        cat = mock_catalog(routes)
+        workspace = cat.get_workspaces()[0]
+        store = cat.get_stores()[0]
+        resources = store.get_resources()
+        layers = cat.get_layers()
+
+        # given in reverse dependency order
+        objs = [workspace, store] + resources + layers
+        results = cat.delete_many(objs, concurrency=4)
+        self.assertEqual(objs, [r.obj for r in results])
+        self.assertEqual([True, True, True, True, True, False], [r.ok for r in results])
+
+        # every level finished before the next one started, a failure does not stop the others
+        deleted = [url for method, url in cat.http_request.requests if method == 'delete']
+        self.assertEqual(6, len(deleted))
+        self.assertEqual({MOCK_URL + '/layers/ws:wind.xml', MOCK_URL + '/layers/ws:rain.xml'}, set(deleted[:2]))
+        self.assertEqual({r.href for r in resources}, set(deleted[2:4]))
+        self.assertEqual([store.href, workspace.href], deleted[4:])
+
+        # the deleted objects evicted their listings
+        cat.get_layers()
+        self.assertEqual(2, cat.http_request.count('get', MOCK_URL + '/layers.xml'))
+
+    def testAddGranules(self):
+        store = MOCK_URL + '/workspaces/ws/coveragestores/mosaic'
+        received = []
+
+        def harvest(url, data, headers):
+            received.append((headers["Content-type"], data if isinstance(data, str) else data.read()))
+            return (500, b'Internal error') if data == 'file:/data/b.tif' else (202, b'')
+
+        cat = mock_catalog({
+            ('post', store + '/external.imagemosaic'): harvest,
+            ('post', store + '/file.imagemosaic'): harvest,
+        })
+        cat._cache.set(store + '.xml', CachedDocument(b'<coverageStore/>'))
+        with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as f:
+            f.write(b'zipped granules')
+        try:
+            results = cat.add_granules(['/data/a.tif', 'file:/data/b.tif', f.name], 'mosaic', 'ws', concurrency=3)
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual([True, False, True], [r.ok for r in results])
+        self.assertEqual(['/data/a.tif', 'file:/data/b.tif', f.name], [r.obj for r in results])
+        self.assertIsInstance(results[1].error, FailedRequestError)
+        # one request per path, zips are uploaded, the rest harvested in place
+        self.assertEqual([
+            ("application/zip", b'zipped granules'),
+            ("text/plain", 'file:/data/a.tif'),
+            ("text/plain", 'file:/data/b.tif'),
+        ], sorted(received, key=repr))
+        self.assertNotIn(store + '.xml', cat._cache)
+
+        with self.assertRaises(ValueError):
+            cat.add_granules(['/data/a.tif'], 'mosaic')
+
+    def testIterGranules(self):
+        granules = MOCK_URL + '/workspaces/ws/coveragestores/mosaic/coverages/wind/index/granules.json'
+        offsets = []
+        second_page = threading.Event()
+
+        def page(count):
+            def respond(url, data, headers):
+                params = dict(p.split('=') for p in url.split('?')[1].split('&'))
+                offset, limit = int(params['offset']), int(params['limit'])
+                offsets.append(offset)
+                if offset == limit:
+                    second_page.set()
+                features = [{'id': 'wind.%d' % i} for i in range(offset, min(offset + limit, count))]
+                return 200, json.dumps({'type': 'FeatureCollection', 'features': features}).encode('utf-8')
+            return respond
+
+        for prefetch in (False, True):
+            cat = mock_catalog({('get', granules): page(5)})
+            del offsets[:]
+            second_page.clear()
+            features = cat.iter_granules('wind', 'mosaic', 'ws', page_size=2, prefetch=prefetch)
+            self.assertEqual('wind.0', next(features)['id'])
+            # pages are requested as they are consumed, with prefetch one page ahead
+            if prefetch:
+                self.assertTrue(second_page.wait(5))
+            self.assertEqual([0, 2] if prefetch else [0], offsets)
+            self.assertEqual(['wind.%d' % i for i in range(1, 5)], [f['id'] for f in features])
+            # a short page is the last one
+            self.assertEqual([0, 2, 4], offsets)
+
+        # a full last page takes one more (empty) request to tell
+        cat = mock_catalog({('get', granules): page(4)})
+        del offsets[:]
+        self.assertEqual(4, len(list(cat.iter_granules('wind', 'mosaic', 'ws', page_size=2))))
+        self.assertEqual([0, 2, 4], offsets)
+
+    def testPublishManyTwice(self):
+        module = customer_layer()
+        CoverageLayer, LayerError = module.CoverageLayer, module.LayerError
+        ws = MOCK_URL + '/workspaces/ws'
+        published = []
+
+        def post(url, data, headers):
+            published.append(re.search(b'<name>([^<]*)</name>', data).group(1).decode())
+            return 201, b''
+
+        cat = mock_catalog({
+            ('get', ws + '/layers.xml'): lambda url, data, headers: (200, listing('layer', published)),
+            ('get', ws + '/coveragestores.xml'): (200, listing('coverageStore', ['nc'])),
+            ('post', ws + '/coveragestores/nc/coverages'): post,
+        })
+        layer = CoverageLayer(cat, 'ws', 'nc')
+        bands = [{'name': 'x_wind_10m'}]
+
+        first = layer.publish_many([('nc', 'wind', bands), ('nc', 'rain', bands)])
+        self.assertEqual([True, True], [r.ok for r in first])
+        # a second batch within the cache ttl sees the layers of the first one
+        second = layer.publish_many([('nc', 'wind', bands), ('nc', 'snow', bands), ('nc', 'snow', bands)])
+        self.assertEqual([False, True, False], [r.ok for r in second])
+        self.assertIsInstance(second[0].error, LayerError)
+        self.assertIsInstance(second[2].error, LayerError)
+        self.assertEqual(['wind', 'rain', 'snow'], published)
+        self.assertEqual(2, cat.http_request.count('get', ws + '/layers.xml'))
+        self.assertEqual(1, cat.http_request.count('get', ws + '/coveragestores.xml'))
+
+    def testPublishExistingLayer(self):
+        module = customer_layer()
+        CoverageLayer, LayerError = module.CoverageLayer, module.LayerError
+        ws = MOCK_URL + '/workspaces/ws'
+        cat = mock_catalog({
+            # wind is published in ws, rain only in another workspace
+            ('get', ws + '/layers.xml'): (200, listing('layer', ['wind'])),
+            ('get', MOCK_URL + '/layers/ws:wind.xml'): (200, layer_document('wind', 'ws', 'nc')),
+            ('get', MOCK_URL + '/layers/rain.xml'): (200, layer_document('rain', 'other', 'nc')),
+            ('get', ws + '/coveragestores.xml'): (200, listing('coverageStore', ['nc'])),
+            ('get', ws + '/coveragestores/nc.xml'): (200, b'<coverageStore><name>nc</name></coverageStore>'),
+            ('post', ws + '/coveragestores/nc/coverages'): (201, b''),
+        })
+        layer = CoverageLayer(cat, 'ws', 'nc')
+        bands = [{'name': 'x_wind_10m'}]
+
+        # publish and publish_many agree on what already exists
+        with self.assertRaises(LayerError):
+            layer._create_layer('wind', 'nc', 'wind', bands)
+        self.assertEqual(201, layer.publish('rain', bands).status_code)
+        results = layer.publish_many([('nc', 'wind', bands), ('nc', 'rain', bands)])
+        self.assertIsInstance(results[0].error, LayerError)
+        self.assertTrue(results[1].ok)
+        self.assertEqual(0, cat.http_request.count('get', MOCK_URL + '/layers/rain.xml'))
+
+    def testCustomerWrites(self):
+        ws = MOCK_URL + '/workspaces/ws'
+        cat = mock_catalog({
+            ('get', ws + '/coveragestores/nc.xml'): (200, b'<coverageStore><name>nc</name></coverageStore>'),
+            ('get', ws + '/styles.xml'): (200, listing('style', ['wind'])),
+            ('post', ws + '/coveragestores/nc/coverages'): (201, b''),
+            ('put', ws + '/layers/wind'): (200, b''),
+        })
+        listings = [MOCK_URL + '/layers.xml', ws + '/layers.xml', ws + '/coveragestores/nc/coverages.xml']
+        layers = [MOCK_URL + '/layers/ws:wind.xml', MOCK_URL + '/layers/wind.xml', ws + '/layers/wind.xml']
+
+        def cached(urls):
+            return [url for url in urls if url in cat._cache]
+
+        for url in listings:
+            cat._cache.set(url, CachedDocument(b'<x/>'))
+        # publishing goes through the catalog transport and evicts the listings
+        layer = customer_layer().CoverageLayer(cat, 'ws', 'nc')
+        self.assertEqual(201, layer.publish('wind', [{'name': 'x_wind_10m'}]).status_code)
+        self.assertEqual(1, cat.http_request.count('post', ws + '/coveragestores/nc/coverages'))
+        self.assertEqual([], cached(listings))
+
+        # so does binding a style, which evicts every url the layer is read from
+        for url in layers:
+            cat._cache.set(url, CachedDocument(b'<layer/>'))
+        customer_style().bind_layer_style(cat, 'wind', 'wind', 'wind', 'ws')
+        self.assertEqual(1, cat.http_request.count('put', ws + '/layers/wind'))
+        self.assertEqual([], cached(layers))
+
+    def testUploadStream(self):
+        progress = []
+        stream = UploadStream(io.BytesIO(b'0123456789'), lambda sent, total: progress.append((sent, total)))
+        self.assertEqual(10, len(stream))
+        self.assertEqual(b'0123', stream.read(4))
+        self.assertEqual(b'456789', stream.read(8192))
+        self.assertEqual(b'', stream.read(8192))
+        self.assertEqual([(4, 10), (10, 10)], progress)
+        # rewound before a retry
+        stream.seek(0)
+        self.assertEqual(0, stream.bytes_sent)
+        self.assertEqual(b'0123456789', stream.read())
+
+    def testUploadBundle(self):
+        data = {'shp': io.BytesIO(b'shapes' * 100), 'png': io.BytesIO(b'pixels')}
+        bundle = UploadBundle('states', data, compresslevel=6, chunk_size=64)
+        for _ in range(2):
+            # iterating again rebuilds the same archive (eg: on a retried request)
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(bundle)))
+            self.assertEqual(b'shapes' * 100, archive.read('states.shp'))
+            self.assertEqual(b'pixels', archive.read('states.png'))
+            self.assertEqual(zipfile.ZIP_DEFLATED, archive.getinfo('states.shp').compress_type)
+            self.assertEqual(zipfile.ZIP_STORED, archive.getinfo('states.png').compress_type)
+
+    def testParseVersion(self):
+        self.assertEqual((2, 15, 1), parse_version("2.15.1"))
+        self.assertEqual((2, 16), parse_version("2.16-SNAPSHOT"))
+        self.assertEqual((2, 2), parse_version("2.2.x"))
+        self.assertTrue(parse_version("2.9.0") < (2, 13))
+
+    def testCoverageViewTemplate(self):
+        def coverage(name, bands, store='store'):
+            view = dict(name=name, envelopeCompositionType='INTERSECTION', selectedResolution='BEST',
+                        selectedResolutionIndex='-1', coverageBands=dict(
+                            ('coverageband_%d' % i, dict(definition=band, index=i, inputCoverageBands=dict(
+                                inputCoverageBand=dict(coverageName=band))))
+                            for i, band in enumerate(bands)))
+            return dict(
+                name=name, nativeName=name, namespace=dict(name='ws', atom='ws'), title=name,
+                description='Generated from NetCDF', nativeCoverageName=name, enabled='true',
+                nativeFormat='NetCDF', requestSRS=dict(string='EPSG:4326'), responseSRS=dict(string='EPSG:4326'),
+                defaultInterpolationMethod='nearest neighbor',
+                metadata=[dict(key='cachingEnabled', name='entry', tag='', val='false'),
+                          dict(key='dirName', name='entry', tag='', val='%s_%s' % (store, name)),
+                          dict(key='COVERAGE_VIEW', name='entry', tag='', val=dict(coverageview=view))],
+                store=dict(classname='coverageStore', name='ws:%s' % store),
+                dimensions=dict(
+                    ('coverageDimension_%d' % i, CoverageDimensionMidModel(
+                        band, 'GridSampleDimension[-Infinity,Infinity]', ['-inf', 'inf'], 'REAL_32BITS'))
+                    for i, band in enumerate(bands)))
+
+        def expected(info):
+            return tostring(coverageview_xml(info).close(), encoding='utf-8', method='xml')
+
+        template = CoverageViewTemplate(coverage('layer', ['band']))
+        for info in [coverage('wind', ['x_wind_10m', 'y_wind_10m']),
+                     coverage('a&b <c>', ['{0}', '@@1@@', u'风'], store='other'),
+                     coverage('no_bands', []),
+                     coverage('empty_band', [''])]:
+            self.assertEqual(expected(info), template.render(info))
+        changed = coverage('wind', ['x_wind_10m'])
+        changed['nativeFormat'] = 'GeoTIFF'
+        self.assertEqual(expected(changed), template.render(changed))
+        numeric = coverage('wind', ['x_wind_10m'])
+        numeric['dimensions']['coverageDimension_0'].range = [0, 1.5]
+        self.assertIn(b'<range><min>0</min><max>1.5</max></range>', template.render(numeric))
+        self.assertEqual(expected(numeric), template.render(numeric))
+
+        # build_coverage takes numeric band ranges
+        layer = customer_layer().CoverageLayer(mock_catalog(), 'ws', 'nc')
+        info = layer.build_coverage('wind', [{'name': 'x_wind_10m', 'range': (0, 1.5)}])
+        self.assertEqual(['0', '1.5'], info['dimensions']['coverageDimension_0'].range)
+        self.assertIn(b'<range><min>0</min><max>1.5</max></range>', layer._msg(info))
+
+    def testNetCDFHeader(self):
+        header = read_header('test/data/polyphemus_20120401.nc')
+        self.assertEqual('CDF-1', header.file_format)
+        self.assertEqual({'time': 2, 'z': 2, 'lat': 48, 'lon': 80}, dict(header.dimensions))
+        self.assertEqual('time', header.unlimited)
+        self.assertEqual(['O3', 'NO2'], [b['name'] for b in header.bands()])
+        self.assertEqual(['-inf', 'inf'], header.bands()[0]['range'])
+        self.assertEqual('REAL_32BITS', header.coverage_dimensions(['NO2'])[0].type)
+        self.assertEqual(('4.9375', '14.9375', '44.9375', '50.9375', 'EPSG:4326'), header.bbox)
+        self.assertEqual('80 48', header.grid['high'])
+        self.assertEqual('0.125', header.grid['scaleX'])
+        self.assertRaises(ValueError, read_header, 'test/data/states.prj')
+
 
 class CatalogTests(unittest.TestCase):
     def setUp(self):